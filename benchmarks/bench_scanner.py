@@ -0,0 +1,178 @@
+"""Scanner micro-benchmark and pattern regression check.
+
+Measures MB/s of every checker's extract_keys and of the full /data scan path (KeyScanner fed through StreamingScan in
+NEKEE_SCAN_CHUNK_SIZE chunks) over each synthetic corpus, checks that every planted key is still found, and compares
+the speeds with benchmarks/baselines/scanner.json.
+
+Speeds are stored relative to a character-class search over the same corpus, which takes most of the difference between
+machines out of the comparison.
+
+    python benchmarks/bench_scanner.py                   # compare with the baseline, exit 1 on a regression
+    python benchmarks/bench_scanner.py --save-baseline   # record the current speeds as the new baseline
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEKEE_STORAGE_DIR", tempfile.mkdtemp(prefix="nekee-bench-"))
+
+from benchmarks.corpus import GENERATORS, generate
+from key_checkers.anthropic import AnthropicKeyChecker
+from key_checkers.aws import AWSKeyChecker
+from key_checkers.elevenlabs import ElevenLabsKeyChecker
+from key_checkers.google import GoogleKeyChecker
+from key_checkers.openai import OpenAIKeyChecker
+from key_checkers.openrouter import OpenRouterKeyChecker
+from key_checkers.scanner import KeyScanner, StreamingScan
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "scanner.json")
+FULL_SCAN = "full_scan"
+
+
+def best_times(fn, reference_fn, repeats: int, min_total: float = 0.2) -> tuple[float, float]:
+    # Runs are interleaved with the reference so both see the same machine load, and fast patterns that finish a
+    # corpus in well under a millisecond are repeated until the timing settles.
+    best = [float("inf"), float("inf")]
+    runs = 0
+    total = 0.0
+    while runs < repeats or total < min_total:
+        for index, target in enumerate((fn, reference_fn)):
+            started = time.perf_counter()
+            target()
+            elapsed = time.perf_counter() - started
+            best[index] = min(best[index], elapsed)
+            total += elapsed
+        runs += 1
+    return best[0], best[1]
+
+
+def stream_scan(scanner: KeyScanner, data: bytes, chunk_size: int) -> StreamingScan:
+    scan = StreamingScan(scanner)
+    for offset in range(0, len(data), chunk_size):
+        scan.feed(data[offset:offset + chunk_size])
+    scan.feed(b"", final=True)
+    return scan
+
+
+def found_key(checker, key) -> str:
+    # AWS matches are (access key, secret) pairs; the checker stores them joined.
+    return ":".join(key) if isinstance(key, tuple) else key
+
+
+def run(size: int, repeats: int, chunk_size: int, corpora: list[str]) -> tuple[dict, list[str]]:
+    checkers = [
+        OpenAIKeyChecker(),
+        AnthropicKeyChecker(),
+        GoogleKeyChecker(),
+        ElevenLabsKeyChecker(),
+        OpenRouterKeyChecker(),
+        AWSKeyChecker(),
+    ]
+    scanner = KeyScanner(checkers)
+    # Has to look at every character, like most of the key patterns, but never matches.
+    calibration = re.compile(r"[\x00-\x08]{4}")
+    results = {}
+    missing = []
+    for kind in corpora:
+        corpus = generate(kind, size)
+        text = corpus.text()
+        data = text.encode("utf-8")
+        megabytes = len(data) / 2**20
+        targets = {checker.get_name(): (lambda checker=checker: checker.extract_keys(text)) for checker in checkers}
+        targets[FULL_SCAN] = lambda: stream_scan(scanner, data, chunk_size)
+        speeds = {}
+        relative = {}
+        for name, target in targets.items():
+            elapsed, reference = best_times(target, lambda: calibration.search(text), repeats)
+            speeds[name] = megabytes / elapsed
+            relative[name] = reference / elapsed
+        scan = stream_scan(scanner, data, chunk_size)
+        results[kind] = {
+            "bytes": len(data),
+            "mb_s": speeds,
+            "relative": relative,
+            # Distinct matches per candidate lane, i.e. how many of them would cost a network call right away.
+            "candidates": {
+                checker.get_name(): dict(sorted(counts.items())) for checker, counts in scan.lane_counts().items() if counts
+            },
+        }
+
+        # Whatever lane a match ends up in, the pattern itself still has to find it.
+        for checker in checkers:
+            keys = {found_key(checker, key) for key in scan.lanes[checker]}
+            for key in corpus.planted[checker.get_name()] - keys:
+                missing.append(f"{kind}: {checker.get_name()} missed {key}")
+    return results, missing
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for kind, result in results.items():
+        stored = baseline.get("corpora", {}).get(kind)
+        if not stored:
+            continue
+        for name, current in result["relative"].items():
+            expected = stored.get("relative", {}).get(name)
+            if expected and current < expected * (1 - tolerance):
+                regressions.append(
+                    f"{kind}: {name} at {result['mb_s'][name]:.1f} MB/s is {1 - current / expected:.0%} slower than the baseline"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=1024, help="size of each corpus in KiB")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per measurement; the fastest one counts")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("NEKEE_SCAN_CHUNK_SIZE", str(1024 * 1024))))
+    parser.add_argument("--corpus", action="append", choices=sorted(GENERATORS), help="only run these corpora")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown against the baseline; single-core noise on the fastest patterns reaches ~40%%")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w") # The checkers print while loading their (empty) stores
+    try:
+        results, missing = run(args.size_kb * 1024, args.repeats, args.chunk_size, args.corpus or list(GENERATORS))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        names = list(next(iter(results.values()))["mb_s"])
+        print(f"{'MB/s':12}" + "".join(f"{name:>12}" for name in names))
+        for kind, result in results.items():
+            print(f"{kind:12}" + "".join(f"{result['mb_s'][name]:12.1f}" for name in names))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"size": args.size_kb * 1024, "corpora": results}, f, indent=2)
+            f.write("\n")
+        print("Saved baseline to", args.baseline)
+
+    failures = list(missing)
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("size") == args.size_kb * 1024:
+            failures += compare(results, baseline, args.tolerance)
+        else:
+            print("Baseline was recorded with a different corpus size, skipping the comparison")
+    for failure in failures:
+        print("FAIL", failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
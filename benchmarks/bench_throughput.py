@@ -0,0 +1,238 @@
+"""End-to-end throughput benchmark against local provider stand-ins.
+
+Starts the stub providers and the API in-process with an empty temporary storage directory, posts generated pastes to
+/data from several client threads and reports keys verified per second, /data latency and memory use.
+
+    python benchmarks/bench_throughput.py --requests 200 --payload-kb 64 --keys-per-request 20 --latency 0.05
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_keys import PROVIDERS, make_key
+from benchmarks.stub_providers import add_stub_arguments, base_urls, start_stub_server, stub_config_from_args
+
+FILLER_LINES = [
+    "INFO  [worker-{n}] processed batch {n} in {ms}ms",
+    "const config = {{ retries: {n}, timeout: {ms}, endpoint: '/api/v{n}/items' }};",
+    "Traceback (most recent call last): File \"app.py\", line {n}, in handler",
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor {n}.",
+    "export OPENAI_MODEL=gpt-4o-mini  # changed in build {n}",
+    "2024-05-{n:02d}T12:{ms:02d}:00Z GET /health 200 {ms}ms",
+]
+
+
+def make_payload(rng: random.Random, size: int, key_count: int, providers: list[str]) -> tuple[str, list[tuple[str, str]]]:
+    keys = []
+    parts = []
+    for _ in range(key_count):
+        provider = rng.choice(providers)
+        key, text = make_key(provider, rng)
+        keys.append((provider, key))
+        parts.append(text)
+    filler_size = max(size - sum(len(part) for part in parts), 0)
+    filler = []
+    while filler_size > 0:
+        line = rng.choice(FILLER_LINES).format(n=rng.randint(1, 28), ms=rng.randint(0, 59))
+        filler.append(line)
+        filler_size -= len(line) + 1
+    # Keys land between filler lines, so they're separated by whitespace as in a real paste.
+    for part in parts:
+        filler.insert(rng.randint(0, len(filler)), part)
+    return "\n".join(filler), keys
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100, help="number of /data requests")
+    parser.add_argument("--payload-kb", type=float, default=32, help="size of each /data body in KiB")
+    parser.add_argument("--keys-per-request", type=int, default=10, help="keys embedded in each body")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent /data clients")
+    parser.add_argument("--providers", default=",".join(PROVIDERS), help="comma-separated providers to generate keys for")
+    parser.add_argument("--host-rate", type=float, default=1000, help="NEKEE_HOST_RATE for the stub host")
+    parser.add_argument("--verify-concurrency", type=int, default=16, help="NEKEE_VERIFY_CONCURRENCY")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the checkers' per-key output")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub_config = stub_config_from_args(args)
+    stub = start_stub_server(stub_config)
+    storage_dir = tempfile.mkdtemp(prefix="nekee-bench-")
+    os.environ.update({
+        "NEKEE_STORAGE_DIR": storage_dir,
+        "NEKEE_PASSWORD": "bench",
+        "NEKEE_USERNAME": "bench",
+        "NEKEE_HOST_RATE": str(args.host_rate),
+        "NEKEE_VERIFY_CONCURRENCY": str(args.verify_concurrency),
+    })
+    for provider, url in base_urls(stub).items():
+        os.environ[f"NEKEE_{provider.upper()}_BASE_URL"] = url
+
+    import uvicorn
+    import main as app_module
+    from key_checkers.key_checker import get_enrichment_queue, get_low_priority_lane
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-api", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    rng = random.Random(args.seed)
+    providers = [provider.strip() for provider in args.providers.split(",") if provider.strip()]
+    payloads = [make_payload(rng, int(args.payload_kb * 1024), args.keys_per_request, providers) for _ in range(args.requests)]
+    submitted = {key for _, keys in payloads for key in keys}
+    authorization = "Basic " + base64.b64encode(b"bench:bench").decode("ascii")
+    url = f"http://127.0.0.1:{port}/data"
+
+    latencies: list[float] = []
+    failures = 0
+    rejected = 0
+    peak_rss = rss_bytes()
+    rss_before = peak_rss
+    done = threading.Event()
+
+    def sample_memory():
+        nonlocal peak_rss
+        while not done.wait(0.1):
+            peak_rss = max(peak_rss, rss_bytes())
+
+    def post(body: str):
+        request = urllib.request.Request(
+            url,
+            data=body.encode("utf-8"),
+            headers={"Authorization": authorization, "Content-Type": "text/plain"},
+            method="POST",
+        )
+        nonlocal rejected
+        started = time.perf_counter()
+        while True:
+            try:
+                with urllib.request.urlopen(request, timeout=600) as resp:
+                    resp.read()
+                return time.perf_counter() - started
+            except urllib.error.HTTPError as err:
+                # A full ingest queue asks the client to come back later; that wait counts towards the latency.
+                if err.code != 503:
+                    raise
+                rejected += 1
+                time.sleep(min(float(err.headers.get("Retry-After", "1")), 5))
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            for future in [pool.submit(post, body) for body, _ in payloads]:
+                try:
+                    latencies.append(future.result())
+                except Exception:
+                    failures += 1
+        # /data answers once the keys are queued, so the run ends when the ingest queue has drained.
+        while app_module.ingest_queue.depth():
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        # Tiers are looked up afterwards on the enrichment queue, timed on its own along with the OpenRouter child key
+        # walks it starts in the background.
+        enrichment = get_enrichment_queue()
+        discoveries = [checker for checker in app_module.key_checkers if hasattr(checker, "discoveries_running")]
+        while enrichment.depth() or enrichment.running() or any(checker.discoveries_running() for checker in discoveries):
+            time.sleep(0.01)
+        enrichment_elapsed = time.perf_counter() - started - elapsed
+        # Low-confidence candidates (bare hex with no context) are only verified once everything else is done.
+        low_priority = get_low_priority_lane()
+        while low_priority.depth() or low_priority.running():
+            time.sleep(0.01)
+        low_priority_elapsed = time.perf_counter() - started - elapsed - enrichment_elapsed
+    finally:
+        done.set()
+        if not args.verbose:
+            sys.stdout.close()
+            sys.stdout = stdout
+    server.should_exit = True
+
+    stored = sum(len(checker.keys) for checker in app_module.key_checkers)
+    upstream = sum(stub_config.counts.values())
+    results = {
+        "requests": args.requests,
+        "failed_requests": failures,
+        "rejected_requests": rejected,
+        "payload_bytes": int(args.payload_kb * 1024),
+        "keys_submitted": len(submitted),
+        "keys_stored": stored,
+        "elapsed_seconds": round(elapsed, 3),
+        "keys_verified_per_second": round(len(submitted) / elapsed, 1) if elapsed else 0.0,
+        "enrichment_seconds": round(enrichment_elapsed, 3),
+        "low_priority_seconds": round(low_priority_elapsed, 3),
+        "keys_pending": sum(checker.count_keys("pending") for checker in app_module.key_checkers),
+        "ingest_mb_per_second": round(args.requests * args.payload_kb / 1024 / elapsed, 2) if elapsed else 0.0,
+        "upstream_requests": upstream,
+        "upstream_by_status": {
+            f"{provider}:{status}": count for (provider, status), count in sorted(stub_config.counts.items())
+        },
+        "latency_seconds": {
+            "mean": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.5), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "max": round(max(latencies, default=0.0), 4),
+        },
+        "rss_mb": {
+            "before": round(rss_before / 2**20, 1),
+            "peak": round(peak_rss / 2**20, 1),
+            "max_rss": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "storage_dir": storage_dir,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, value in results.items():
+        print(f"{name:26} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Deterministic synthetic corpora for the scanner benchmark.
+
+Each generator returns a Corpus holding the text and the keys planted in it, as {provider: set of keys in the form the
+checker stores them}, so the benchmark can also check that a pattern change didn't stop finding them.
+"""
+
+import base64
+import hashlib
+import random
+import string
+
+try:
+    from .fake_keys import HEX, PROVIDERS, URLSAFE, make_key
+except ImportError:
+    from fake_keys import HEX, PROVIDERS, URLSAFE, make_key
+
+WORDS = (
+    "the request failed because token config value server client retry timeout user error warning deploy build "
+    "cache session update function return undefined null true false import export default module async await"
+).split()
+JS_IDENTIFIERS = ["e", "t", "n", "r", "o", "i", "a", "s", "u", "c", "l", "f", "d", "p", "h", "m"]
+
+
+class Corpus:
+    def __init__(self, rng: random.Random, size: int, key_every: int, key_wrap: str = "\n{}\n"):
+        self.rng = rng
+        self.size = size
+        self.key_every = key_every # Roughly one planted key per this many characters; 0 plants none
+        self.key_wrap = key_wrap
+        self.parts: list[str] = []
+        self.length = 0
+        self.planted: dict[str, set] = {provider: set() for provider in PROVIDERS}
+        self._next_key_at = self._gap()
+
+    def _gap(self) -> int:
+        return self.rng.randint(self.key_every // 2, self.key_every * 3 // 2) if self.key_every else -1
+
+    def add(self, text: str):
+        self.parts.append(text)
+        self.length += len(text)
+        if self._next_key_at >= 0 and self.length >= self._next_key_at:
+            self.parts.append(self.key_text())
+            self._next_key_at = self.length + self._gap()
+
+    def key_text(self) -> str:
+        provider = self.rng.choice(PROVIDERS)
+        key, text = make_key(provider, self.rng)
+        self.planted[provider].add(key)
+        return self.key_wrap.format(text)
+
+    def full(self) -> bool:
+        return self.length >= self.size
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choices(WORDS, k=count))
+
+
+def paste(rng: random.Random, size: int, key_every: int = 4096) -> Corpus:
+    # .env files, shell history, stack traces and prose, the way keys usually turn up.
+    corpus = Corpus(rng, size, key_every)
+    while not corpus.full():
+        kind = rng.randrange(4)
+        if kind == 0:
+            corpus.add(f"{rng.choice(WORDS).upper()}_{rng.choice(WORDS).upper()}={rng.randint(0, 10**6)}\n")
+        elif kind == 1:
+            corpus.add(f"$ curl -s https://example.com/{rng.choice(WORDS)}/{rng.randint(1, 999)} -H 'Accept: */*'\n")
+        elif kind == 2:
+            corpus.add(f'  File "/srv/app/{rng.choice(WORDS)}.py", line {rng.randint(1, 900)}, in {rng.choice(WORDS)}\n')
+        else:
+            corpus.add(_words(rng, rng.randint(5, 30)).capitalize() + ".\n")
+    return corpus
+
+
+def minified_js(rng: random.Random, size: int, key_every: int = 16384) -> Corpus:
+    # One enormous line of short identifiers and string literals, keys inside quotes.
+    corpus = Corpus(rng, size, key_every, key_wrap='"{}"')
+    while not corpus.full():
+        a, b, c = rng.choices(JS_IDENTIFIERS, k=3)
+        kind = rng.randrange(4)
+        if kind == 0:
+            corpus.add(f"function {a}{b}({c}){{return {c}&&{c}.{rng.choice(WORDS)}||{rng.randint(0, 99)}}};")
+        elif kind == 1:
+            corpus.add(f'var {a}="{"".join(rng.choices(URLSAFE, k=rng.randint(4, 40)))}",{b}={a}.split("");')
+        elif kind == 2:
+            corpus.add(f"{a}.prototype.{rng.choice(WORDS)}=function(){{this.{b}=!0,this.{c}=void 0}},")
+        else:
+            corpus.add(f'{a}["{rng.choice(WORDS)}"]=[{",".join(str(rng.randint(0, 255)) for _ in range(8))}];')
+    return corpus
+
+
+def base64_blobs(rng: random.Random, size: int, key_every: int = 65536) -> Corpus:
+    # Embedded files and data URIs: long runs of [A-Za-z0-9+/] that look a lot like AWS secrets.
+    corpus = Corpus(rng, size, key_every)
+    while not corpus.full():
+        blob = base64.b64encode(rng.randbytes(rng.randint(300, 3000))).decode("ascii")
+        if rng.random() < 0.5:
+            blob = "\n".join(blob[i:i + 76] for i in range(0, len(blob), 76))
+        corpus.add(f"data:application/octet-stream;base64,{blob}\n")
+    return corpus
+
+
+def hash_logs(rng: random.Random, size: int, key_every: int = 8192) -> Corpus:
+    # Build and VCS logs full of md5/sha1/sha256 digests; every md5 is also a candidate bare ElevenLabs key.
+    corpus = Corpus(rng, size, key_every)
+    while not corpus.full():
+        seed = rng.randbytes(16)
+        kind = rng.randrange(3)
+        if kind == 0:
+            corpus.add(f"{hashlib.md5(seed).hexdigest()}  dist/{rng.choice(WORDS)}.tar.gz\n")
+        elif kind == 1:
+            corpus.add(f"commit {hashlib.sha1(seed).hexdigest()} Merge branch '{rng.choice(WORDS)}'\n")
+        else:
+            corpus.add(f"sha256:{hashlib.sha256(seed).hexdigest()} layer {rng.randint(1, 40)} pulled\n")
+    return corpus
+
+
+def adversarial(rng: random.Random, size: int, key_every: int = 0) -> Corpus:
+    # Near misses aimed at each pattern's slow path: access key ids with no secret after them (the lazy [\s\S]*?
+    # then runs to the end of the text), "sk-" runs that never reach T3BlbkFJ, and long unbroken hex.
+    corpus = Corpus(rng, size, key_every)
+    while not corpus.full():
+        kind = rng.randrange(5)
+        if kind == 0:
+            corpus.add(f"AKIA{''.join(rng.choices(string.ascii_uppercase + string.digits, k=16))} " + _words(rng, 200) + "\n")
+        elif kind == 1:
+            corpus.add("sk-" + "-sk-".join("".join(rng.choices(URLSAFE, k=rng.randint(8, 64))) for _ in range(20)) + "\n")
+        elif kind == 2:
+            corpus.add("".join(rng.choices(HEX, k=rng.randint(33, 512))) + "\n")
+        elif kind == 3:
+            corpus.add("sk-ant-api03-" + "".join(rng.choices(URLSAFE, k=92)) + " AIza" + "".join(rng.choices(URLSAFE, k=34)) + "\n")
+        else:
+            corpus.add("sk_" + "".join(rng.choices(HEX, k=47)) + " sk-or-v1-" + "".join(rng.choices(HEX, k=63)) + "\n")
+    return corpus
+
+
+GENERATORS = {
+    "paste": paste,
+    "minified_js": minified_js,
+    "base64": base64_blobs,
+    "hash_logs": hash_logs,
+    "adversarial": adversarial,
+}
+
+
+def generate(kind: str, size: int, seed: int = 0) -> Corpus:
+    return GENERATORS[kind](random.Random(f"{kind}:{seed}"), size)
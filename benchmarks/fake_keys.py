@@ -0,0 +1,64 @@
+import random
+import string
+
+ALNUM = string.ascii_letters + string.digits
+URLSAFE = ALNUM + "_-"
+LOWER_ALNUM = string.ascii_lowercase + string.digits
+HEX = "0123456789abcdef"
+UPPER_ALNUM = string.ascii_uppercase + string.digits
+
+PROVIDERS = ("openai", "anthropic", "google", "elevenlabs", "openrouter", "aws")
+
+
+def _chars(rng: random.Random, alphabet: str, length: int) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+# Each generator returns (key as the checker stores it, text as it appears in a paste).
+def openai_key(rng: random.Random) -> tuple[str, str]:
+    key = f"sk-proj-{_chars(rng, URLSAFE, 74)}T3BlbkFJ{_chars(rng, URLSAFE, 74)}"
+    return key, key
+
+
+def anthropic_key(rng: random.Random) -> tuple[str, str]:
+    key = f"sk-ant-api03-{_chars(rng, URLSAFE, 93)}AA"
+    return key, key
+
+
+def google_key(rng: random.Random) -> tuple[str, str]:
+    key = f"AIza{_chars(rng, URLSAFE, 35)}"
+    return key, key
+
+
+def elevenlabs_key(rng: random.Random) -> tuple[str, str]:
+    if rng.random() < 0.2:
+        key = _chars(rng, HEX, 32)
+    else:
+        key = f"sk_{_chars(rng, HEX, 48)}"
+    return key, key
+
+
+def openrouter_key(rng: random.Random) -> tuple[str, str]:
+    key = f"sk-or-v1-{_chars(rng, LOWER_ALNUM, 64)}"
+    return key, key
+
+
+def aws_key(rng: random.Random) -> tuple[str, str]:
+    access_key = f"AKIA{_chars(rng, UPPER_ALNUM, 16)}"
+    # Secrets may contain "/" and "+", but the pattern anchors them on word boundaries, so the generated ones don't.
+    secret_key = _chars(rng, ALNUM, 40)
+    return f"{access_key}:{secret_key}", f"aws_access_key_id = {access_key}\naws_secret_access_key = {secret_key}"
+
+
+GENERATORS = {
+    "openai": openai_key,
+    "anthropic": anthropic_key,
+    "google": google_key,
+    "elevenlabs": elevenlabs_key,
+    "openrouter": openrouter_key,
+    "aws": aws_key,
+}
+
+
+def make_key(provider: str, rng: random.Random) -> tuple[str, str]:
+    return GENERATORS[provider](rng)
@@ -0,0 +1,297 @@
+"""Local stand-ins for every provider endpoint the key checkers call.
+
+Whether a key is valid, rate limited, out of quota or invalid is derived from a hash of the key, so every run with the
+same settings sees the same outcome for the same key. On top of that, any request can fail transiently with a 429 or
+400 at a configurable rate, and every response is delayed by a configurable latency.
+
+Run on its own with `python benchmarks/stub_providers.py --port 8900`, then point the checkers at it with
+NEKEE_<NAME>_BASE_URL, e.g. NEKEE_OPENAI_BASE_URL=http://127.0.0.1:8900/openai and
+NEKEE_AWS_BASE_URL=http://127.0.0.1:8900/aws/{region} with NEKEE_AWS_STS_BASE_URL=http://127.0.0.1:8900/aws/sts.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from .fake_keys import PROVIDERS
+except ImportError:
+    from fake_keys import PROVIDERS
+
+OPENAI_TIERS = [(500, 200_000), (5_000, 2_000_000), (5_000, 4_000_000), (10_000, 10_000_000), (30_000, 180_000_000)]
+ANTHROPIC_TIERS = [50, 1_000, 2_000, 4_000]
+ELEVENLABS_TIERS = ["free", "starter", "creator", "pro", "scale", "business"]
+AWS_REGIONS = ["us-east-1", "us-west-2", "eu-central-1", "ap-northeast-1", "eu-west-1"]
+# GET endpoints the checkers ask whether a key is accepted at all; they answer for every key that isn't invalid.
+LIVENESS_PATHS = {
+    "openai": "/v1/models",
+    "anthropic": "/v1/models",
+    "google": "/v1beta/models",
+    "elevenlabs": "/v1/models",
+    "openrouter": "/api/v1/key",
+    "aws": "/sts/",
+}
+
+# (status, body, headers) per provider for each kind of refusal, worded so the checkers classify them as the real
+# providers' responses.
+ERRORS = {
+    "openai": {
+        "invalid": (401, {"error": {"message": "Incorrect API key provided.", "type": "invalid_request_error"}}, {}),
+        "rate": (429, {"error": {"message": "Rate limit reached for gpt-5-nano on requests per min (RPM).", "type": "requests"}}, {}),
+        "quota": (429, {"error": {"message": "You exceeded your current quota, please check your plan and billing details.", "type": "insufficient_quota"}}, {}),
+        "bad_request": (400, {"error": {"message": "Unsupported parameter.", "type": "invalid_request_error"}}, {}),
+    },
+    "anthropic": {
+        "invalid": (401, {"type": "error", "error": {"type": "authentication_error", "message": "invalid x-api-key"}}, {}),
+        "rate": (429, {"type": "error", "error": {"type": "rate_limit_error", "message": "Number of requests has exceeded your rate limit."}}, {}),
+        "quota": (400, {"type": "error", "error": {"type": "invalid_request_error", "message": "Your credit balance is too low to access the Anthropic API."}}, {}),
+        "bad_request": (400, {"type": "error", "error": {"type": "invalid_request_error", "message": "messages: field required"}}, {}),
+    },
+    "google": {
+        "invalid": (400, {"error": {"code": 400, "message": "API key not valid. Please pass a valid API key.", "status": "INVALID_ARGUMENT"}}, {}),
+        "rate": (429, {"error": {"code": 429, "message": "Quota exceeded for metric generate_content_requests per minute.", "status": "RESOURCE_EXHAUSTED"}}, {}),
+        "quota": (429, {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}}, {}),
+        "bad_request": (400, {"error": {"code": 400, "message": "Invalid JSON payload received.", "status": "INVALID_ARGUMENT"}}, {}),
+    },
+    "elevenlabs": {
+        "invalid": (401, {"detail": {"status": "invalid_api_key", "message": "Invalid API key"}}, {}),
+        "rate": (429, {"detail": {"status": "too_many_concurrent_requests", "message": "Too many requests, rate limit hit."}}, {}),
+        "quota": (429, {"detail": {"status": "quota_exceeded", "message": "This request exceeds your quota."}}, {}),
+        "bad_request": (400, {"detail": {"status": "bad_request", "message": "Malformed request."}}, {}),
+    },
+    "openrouter": {
+        "invalid": (401, {"error": {"message": "User not found.", "code": 401}}, {}),
+        "rate": (429, {"error": {"message": "Rate limit exceeded.", "code": 429}}, {}),
+        "quota": (429, {"error": {"message": "Key quota exhausted.", "code": 429}}, {}),
+        "bad_request": (400, {"error": {"message": "Bad request.", "code": 400}}, {}),
+    },
+    "aws": {
+        "invalid": (403, {"message": "The security token included in the request is invalid."}, {"x-amzn-ErrorType": "UnrecognizedClientException:http://internal.amazon.com/coral/com.amazon.coral.service/"}),
+        "rate": (429, {"message": "Too many requests, please wait before trying again."}, {"x-amzn-ErrorType": "ThrottlingException:http://internal.amazon.com/coral/com.amazon.bedrock/"}),
+        "quota": (400, {"message": "Your account has exhausted its quota."}, {"x-amzn-ErrorType": "ServiceQuotaExceededException:http://internal.amazon.com/coral/com.amazon.bedrock/"}),
+        "bad_request": (400, {"message": "Malformed input request, please reformat your input and try again."}, {"x-amzn-ErrorType": "ValidationException:http://internal.amazon.com/coral/com.amazon.bedrock/"}),
+        "not_found": (404, {"message": "Model not found in this region."}, {"x-amzn-ErrorType": "ResourceNotFoundException:http://internal.amazon.com/coral/com.amazon.bedrock/"}),
+    },
+}
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.05 # Seconds added to every response
+    jitter: float = 0.02 # Up to this many extra seconds, uniformly distributed
+    valid: float = 0.3 # Share of keys that verify
+    rate_limited: float = 0.05 # Share of keys that always answer with a rate limit
+    quota: float = 0.05 # Share of keys that have run out of quota; the rest are invalid
+    p429: float = 0.0 # Chance of any request failing with a transient rate limit
+    p400: float = 0.0 # Chance of any request failing with a transient 400
+    retry_after: float = 0.0 # Value of the Retry-After header sent with 429s
+    child_keys: int = 0 # Child keys an OpenRouter key lists
+    seed: int = 0
+    counts: Counter = field(default_factory=Counter)
+    counts_lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def count(self, provider: str, status: int):
+        with self.counts_lock:
+            self.counts[(provider, status)] += 1
+
+    def outcome(self, key: str) -> tuple[str, int]:
+        digest = hashlib.blake2b(f"{self.seed}:{key}".encode("utf-8"), digest_size=8).digest()
+        share = int.from_bytes(digest[:4], "big") / 2**32
+        pick = digest[4]
+        if share < self.valid:
+            return "valid", pick
+        if share < self.valid + self.rate_limited:
+            return "rate", pick
+        if share < self.valid + self.rate_limited + self.quota:
+            return "quota", pick
+        return "invalid", pick
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so the checkers' connection pool behaves as it does against the real APIs
+    config: StubConfig = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _send(self, provider: str, status: int, payload, headers: dict | None = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+        self.config.count(provider, status)
+
+    def _send_error(self, provider: str, kind: str):
+        status, payload, headers = ERRORS[provider][kind]
+        headers = dict(headers)
+        if status == 429:
+            headers["retry-after"] = self.config.retry_after
+        self._send(provider, status, payload, headers)
+
+    def _api_key(self, provider: str) -> str:
+        if provider == "anthropic":
+            return self.headers.get("x-api-key", "")
+        if provider == "google":
+            return self.headers.get("x-goog-api-key", "")
+        if provider == "elevenlabs":
+            return self.headers.get("xi-api-key", "")
+        authorization = self.headers.get("Authorization", "")
+        if provider == "aws":
+            match = re.search(r"Credential=([A-Z0-9]+)/", authorization)
+            return match.group(1) if match else ""
+        return authorization.removeprefix("Bearer ").strip()
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        config = self.config
+        provider, _, path = self.path.lstrip("/").partition("/")
+        path = "/" + path
+        if provider not in PROVIDERS:
+            self._send("unknown", 404, {"error": "unknown provider"})
+            return
+        time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        roll = random.random()
+        if roll < config.p429:
+            self._send_error(provider, "rate")
+            return
+        if roll < config.p429 + config.p400:
+            self._send_error(provider, "bad_request")
+            return
+
+        outcome, pick = config.outcome(self._api_key(provider))
+        if self.command == "GET" and path.split("?", 1)[0] == LIVENESS_PATHS[provider] and outcome != "invalid":
+            getattr(self, f"_ok_{provider}")(path, pick)
+            return
+        if provider == "aws":
+            # A valid AWS key only has the model in its home region; everywhere else reports it missing.
+            region = path.split("/")[1]
+            if outcome == "valid" and region != AWS_REGIONS[pick % len(AWS_REGIONS)]:
+                self._send_error(provider, "not_found")
+                return
+        if outcome != "valid":
+            self._send_error(provider, outcome)
+            return
+        getattr(self, f"_ok_{provider}")(path, pick)
+
+    def _ok_openai(self, path: str, pick: int):
+        rpm, tpm = OPENAI_TIERS[pick % len(OPENAI_TIERS)]
+        self._send("openai", 200, {"id": "resp_stub", "output": [{"type": "message", "content": [{"type": "output_text", "text": "a"}]}]}, {
+            "x-ratelimit-limit-requests": rpm,
+            "x-ratelimit-limit-tokens": tpm,
+            "x-ratelimit-remaining-requests": rpm - 1,
+            "x-ratelimit-remaining-tokens": tpm - 16,
+        })
+
+    def _ok_anthropic(self, path: str, pick: int):
+        rpm = ANTHROPIC_TIERS[pick % len(ANTHROPIC_TIERS)]
+        self._send("anthropic", 200, {"type": "message", "content": [{"type": "text", "text": "a"}]}, {
+            "anthropic-ratelimit-requests-limit": rpm,
+            "anthropic-ratelimit-requests-remaining": rpm - 1,
+        })
+
+    def _ok_google(self, path: str, pick: int):
+        self._send("google", 200, {"candidates": [{"content": {"parts": [{"text": "a"}]}}]})
+
+    def _ok_elevenlabs(self, path: str, pick: int):
+        if path.startswith("/v1/user"):
+            self._send("elevenlabs", 200, {"subscription": {"tier": ELEVENLABS_TIERS[pick % len(ELEVENLABS_TIERS)]}})
+        else:
+            self._send("elevenlabs", 200, [{"model_id": "eleven_multilingual_v2"}])
+
+    def _ok_openrouter(self, path: str, pick: int):
+        if path.startswith("/api/v1/keys"):
+            # Only the generated keys manage others, so discovery stops after one level.
+            provisioning = self._api_key("openrouter").startswith("sk-or-v1-")
+            children = [
+                {"hash": f"{pick:02x}" * 32 + f"{index:04d}", "disabled": False}
+                for index in range(self.config.child_keys if provisioning else 0)
+            ]
+            self._send("openrouter", 200, {"data": children})
+        elif path.startswith("/api/v1/credits"):
+            self._send("openrouter", 200, {"data": {"total_credits": float(pick % 3) * 10, "total_usage": 1.5}})
+        else:
+            self._send("openrouter", 200, {"data": {"label": "stub", "is_free_tier": pick % 4 == 0}})
+
+    def _ok_aws(self, path: str, pick: int):
+        self._send("aws", 200, {"content": [{"type": "text", "text": "a"}]})
+
+
+def start_stub_server(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-providers", daemon=True).start()
+    return server
+
+
+def base_urls(server: ThreadingHTTPServer) -> dict[str, str]:
+    host, port = server.server_address[:2]
+    urls = {provider: f"http://{host}:{port}/{provider}" for provider in PROVIDERS}
+    urls["aws"] += "/{region}"
+    urls["aws_sts"] = f"http://{host}:{port}/aws/sts"
+    return urls
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    defaults = StubConfig()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="seconds added to every stub response")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="extra random latency in seconds")
+    parser.add_argument("--valid", type=float, default=defaults.valid, help="share of keys that verify")
+    parser.add_argument("--rate-limited", type=float, default=defaults.rate_limited, help="share of keys that are always rate limited")
+    parser.add_argument("--quota", type=float, default=defaults.quota, help="share of keys that are out of quota")
+    parser.add_argument("--p429", type=float, default=defaults.p429, help="chance of a transient 429 on any request")
+    parser.add_argument("--p400", type=float, default=defaults.p400, help="chance of a transient 400 on any request")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After sent with 429s")
+    parser.add_argument("--child-keys", type=int, default=defaults.child_keys, help="child keys listed per OpenRouter key")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def stub_config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        valid=args.valid,
+        rate_limited=args.rate_limited,
+        quota=args.quota,
+        p429=args.p429,
+        p400=args.p400,
+        retry_after=args.retry_after,
+        child_keys=args.child_keys,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve stand-ins for the provider APIs the key checkers call.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server = start_stub_server(stub_config_from_args(args), args.host, args.port)
+    for provider, url in base_urls(server).items():
+        print(f"NEKEE_{provider.upper()}_BASE_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
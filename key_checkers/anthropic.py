@@ -9,6 +9,10 @@ import urllib.error
 import json
 
 class AnthropicKeyChecker(KeyChecker):
+    API_BASE_URL = "https://api.anthropic.com"
+    LIVENESS_PATH = "/v1/models"
+    KEY_PREFIXES = ("sk-ant-",)
+    HIGH_TIERS = ("tier_3", "tier_4", "tier_5")
     TIER_BY_LIMITS = {
         50: "Tier_1",
         1_000: "Tier_2",
@@ -22,24 +26,22 @@ class AnthropicKeyChecker(KeyChecker):
         rpm = int((headers.get("anthropic-ratelimit-requests-limit") or "0").replace(",", ""))
         return self.TIER_BY_LIMITS.get(rpm, "Tier_5")
 
-    def verify_key(self, key: str, reverify: bool = False):
-        if key in self.invalid_keys:
-            return
+    def _auth_headers(self, key: str) -> dict[str, str]:
+        return {"x-api-key": key, "anthropic-version": "2023-06-01"}
+
+    def enrich_key(self, key: str):
+        # Rate limit headers, and with them the tier, only come back from a message.
         req = urllib.request.Request(
-            "https://api.anthropic.com/v1/messages",
+            f"{self.api_base_url}/v1/messages",
             data=json.dumps({"model": "claude-3-haiku-20240307", "max_tokens": 16, "messages": [{"role": "user", "content": "Just say \"a\""}]}).encode("utf-8"),
-            headers={
-                "x-api-key": key,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json",
-            },
+            headers={**self._auth_headers(key), "content-type": "application/json"},
             method="POST",
         )
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with self._urlopen(req, timeout=10) as resp:
                 if resp.status >= 400:
                     raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, resp.read())
-                self.keys[key] = self._tier_from_headers(resp.headers)
+                self._set_key_status(key, self._tier_from_headers(resp.headers))
                 print("Verified key", key, "with tier", self.keys[key])
                 self._save_keys()
                 return True
@@ -47,24 +49,15 @@ class AnthropicKeyChecker(KeyChecker):
             if err.code == 429 or err.code == 400:
                 error_message = self._extract_error_message(err).lower()
                 print("Error message:", error_message)
-                if "quota" in error_message or "exhausted" in error_message or "credit" in error_message:
+                if self._quota_exhausted(error_message):
                     print("Monthly usage reached for key", key)
-                    self.monthly_usage_reached_keys.add(key)
+                    self._mark_monthly_usage_reached(key)
+                    return
                 elif "rate" in error_message or "large" in error_message:
                     print("Rate limit reached for key", key, "- retrying in 10 minutes")
-                    self.keys[key] = "rate_limited"
+                    self._set_key_status(key, "rate_limited")
                     self._schedule_retry(key)
                     self._save_keys()
                     return
 
-            if key not in self.keys:
-                print("Not a valid key", key)
-                self.invalid_keys.append(key)
-                return
-            if self.keys[key] == "dead" and not reverify:
-                del self.keys[key]
-                print("Deleted key", key, "because it is dead")
-            else:
-                self.keys[key] = "dead"
-                print("Marked key", key, "as dead")
-            self._save_keys()
+            self._mark_failed(key)
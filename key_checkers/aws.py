@@ -1,21 +1,36 @@
 try:
+    from . import http_client, metrics, sigv4
     from .key_checker import KeyChecker
 except ImportError:
     import os
     import sys
 
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers import http_client, metrics, sigv4
     from key_checkers.key_checker import KeyChecker
 
 import json
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Sequence
 
-import boto3
-from botocore.config import Config
-from botocore.exceptions import BotoCoreError, ClientError
+
+class BedrockError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(f"{code or status}: {message}")
+        self.status = status
+        self.code = code
+        self.message = message
 
 
 class AWSKeyChecker(KeyChecker):
+    KEY_PREFIXES = ("AKIA", "ABIA", "ACCA", "ASIA")
+    MAX_KEY_LENGTH = 4096 # When streaming, an access key and its secret must be within this many characters
     MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
     REQUEST_BODY = {
         "anthropic_version": "bedrock-2023-05-31",
@@ -65,101 +80,255 @@ class AWSKeyChecker(KeyChecker):
     ]
     RATE_LIMIT_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ThrottledException"}
     QUOTA_ERROR_CODES = {"ServiceQuotaExceededException"}
+    # Refusals of the credentials themselves, which every region gives alike.
     INVALID_ERROR_CODES = {
-        "AccessDeniedException",
         "AuthFailure",
         "ExpiredTokenException",
         "IncompleteSignature",
         "InvalidClientTokenId",
         "InvalidSignatureException",
         "MissingAuthenticationToken",
-        "OptInRequired",
         "SignatureDoesNotMatch",
-        "UnauthorizedOperation",
         "UnrecognizedClientException",
     }
+    # Refusals that can come from a policy or an opt-in in one region while another region works.
+    DENIED_ERROR_CODES = {"AccessDeniedException", "OptInRequired", "UnauthorizedOperation"}
+
+    API_BASE_URL = "https://bedrock-runtime.{region}.amazonaws.com"
+    STS_BASE_URL = "https://sts.amazonaws.com" # GetCallerIdentity answers for any valid key and is never billed
+    MAX_CACHED_CLIENTS = 256
 
     def __init__(self):
         super().__init__()
-        self._boto_config = Config(
-            retries={"max_attempts": 1, "mode": "standard"},
-            connect_timeout=5,
-            read_timeout=10,
-        )
         self._serialized_request = json.dumps(self.REQUEST_BODY).encode("utf-8")
+        # boto3 is only imported when the SigV4 fast path is turned off.
+        self._use_boto3 = os.getenv("NEKEE_AWS_USE_BOTO3", "").lower() in ("1", "true", "yes")
+        self._boto_config = None
+        self._session = None
+        self._clients: OrderedDict[tuple[str, str, str], object] = OrderedDict()
+        self._clients_lock = threading.Lock()
+        self.sts_base_url = os.getenv("NEKEE_AWS_STS_BASE_URL", self.STS_BASE_URL).rstrip("/")
+        self._region_concurrency = max(int(os.getenv("NEKEE_AWS_REGION_CONCURRENCY", "2")), 1)
+        self._region_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("NEKEE_AWS_REGION_WORKERS", "32")),
+            thread_name_prefix="aws-region",
+        )
 
     def get_regex_pattern(self) -> str:
         return r"((?:AKIA|ABIA|ACCA|ASIA)[0-9A-Z]{16})\b[\s\S]*?\b([A-Za-z0-9\x2F+=]{40})\b"
 
-    def check_text(self, text: str, reverify: bool = False):
-        for match in super().extract_keys(text):
+    def _is_high_tier(self, status: str) -> bool:
+        return str(status).startswith("region:")
+
+    def _keys_to_verify(self, matches, reverify: bool = False):
+        for match in matches:
             try:
                 serialized_key, _ = self._normalize_input(match)
             except ValueError:
                 continue
+            if serialized_key in self.invalid_keys:
+                continue
             if reverify or (serialized_key not in self.keys):
-                self.verify_key(match, reverify)
-        self.invalid_keys = []
+                yield match
+
+    def _liveness_url(self) -> str:
+        return f"{self.sts_base_url}/?Action=GetCallerIdentity&Version=2011-06-15"
+
+    def _auth_headers(self, key: str | Sequence[str]) -> dict[str, str]:
+        # SigV4 signs the request itself, so these headers are only good for the liveness call.
+        _, (access_key, secret_key) = self._normalize_input(key)
+        return sigv4.sign_request("GET", self._liveness_url(), {"Accept": "application/json"}, b"", access_key, secret_key, "us-east-1", "sts")
 
-    def verify_key(self, key: str | Sequence[str], reverify: bool = False):
+    def _liveness_request(self, key: str | Sequence[str]) -> urllib.request.Request:
+        return urllib.request.Request(self._liveness_url(), headers=self._auth_headers(key), method="GET")
+
+    def check_liveness(self, key: str | Sequence[str], reverify: bool = False):
         try:
-            serialized_key, (access_key, secret_key) = self._normalize_input(key)
+            self._normalize_input(key)
         except ValueError:
             return
+        return super().check_liveness(key, reverify)
+
+    def enrich_key(self, key: str | Sequence[str]):
+        # The key is known to be valid; this finds a region where it can call Bedrock.
+        serialized_key, (access_key, secret_key) = self._normalize_input(key)
 
-        if serialized_key in self.invalid_keys:
+        hint = self._region_hint(serialized_key)
+        regions = [hint] + [region for region in self.BEDROCK_REGIONS if region != hint] if hint else self.BEDROCK_REGIONS
+        outcome, region, last_error = self._probe_regions(access_key, secret_key, regions, solo_first=hint is not None)
+        if outcome == "verified":
+            self._set_key_status(serialized_key, f"region:{region}")
+            print("Verified AWS key", access_key, secret_key, "in region", region)
+            self._save_keys()
+            return True
+        if outcome == "rate_limited":
+            print("Rate limit reached for AWS key", access_key, secret_key, "- retrying in 10 minutes")
+            self._set_key_status(serialized_key, "rate_limited")
+            self._schedule_retry(serialized_key)
+            self._save_keys()
+            return
+        if outcome == "quota":
+            print("Monthly usage reached for AWS key", access_key, secret_key)
+            self._mark_monthly_usage_reached(serialized_key)
+            self._save_keys()
             return
 
-        last_error: Exception | None = None
-        for region in self.BEDROCK_REGIONS:
-            client = boto3.client(
-                "bedrock-runtime",
-                region_name=region,
-                aws_access_key_id=access_key,
-                aws_secret_access_key=secret_key,
-                config=self._boto_config,
-            )
-            try:
-                response = client.invoke_model(
-                    modelId=self.MODEL_ID,
-                    body=self._serialized_request,
-                    contentType="application/json",
-                    accept="application/json",
+        self._handle_failure(serialized_key, access_key, secret_key, last_error)
+
+    def _region_hint(self, serialized_key: str) -> str | None:
+        status = str(self.keys.get(serialized_key, ""))
+        region = status.split(":", 1)[1] if status.startswith("region:") else None
+        return region if region in self.BEDROCK_REGIONS else None
+
+    def _endpoint(self, region: str) -> str:
+        return self.api_base_url.format(region=region)
+
+    def _client(self, access_key: str, secret_key: str, region: str):
+        cache_key = (access_key, secret_key, region)
+        with self._clients_lock:
+            if self._session is None:
+                import boto3
+                from botocore.config import Config
+
+                self._boto_config = Config(
+                    retries={"max_attempts": 1, "mode": "standard"},
+                    connect_timeout=5,
+                    read_timeout=10,
                 )
-                body = response.get("body")
-                if hasattr(body, "read"):
-                    body.read()
-                self.keys[serialized_key] = f"region:{region}"
-                print("Verified AWS key", access_key, secret_key, "in region", region)
-                self._save_keys()
-                return True
-            except ClientError as err:
-                last_error = err
-                code = self._client_error_code(err)
-                message = self._client_error_message(err)
-                if code == "ResourceNotFoundException" or "model" in message and "not found" in message:
-                    continue
-                if self._is_rate_limited(code, message):
-                    print("Rate limit reached for AWS key", access_key, secret_key, "- retrying in 10 minutes")
-                    self.keys[serialized_key] = "rate_limited"
-                    self._schedule_retry(serialized_key)
-                    self._save_keys()
-                    return
-                if self._is_quota_reached(code, message):
-                    print("Monthly usage reached for AWS key", access_key, secret_key)
-                    self.monthly_usage_reached_keys.add(serialized_key)
-                    self._save_keys()
-                    return
-                if self._is_invalid(code, message):
-                    break
-            except (BotoCoreError, TimeoutError) as err:
-                last_error = err
-                continue
-            except Exception as err:
-                last_error = err
-                continue
+                # One session so every client shares its loaded service model; sessions aren't thread-safe, clients are.
+                self._session = boto3.session.Session()
+            client = self._clients.get(cache_key)
+            if client is None:
+                client = self._session.client(
+                    "bedrock-runtime",
+                    region_name=region,
+                    aws_access_key_id=access_key,
+                    aws_secret_access_key=secret_key,
+                    config=self._boto_config,
+                    # Left to botocore unless NEKEE_AWS_BASE_URL points somewhere else.
+                    endpoint_url=self._endpoint(region) if self.api_base_url != self.API_BASE_URL else None,
+                )
+                self._clients[cache_key] = client
+                while len(self._clients) > self.MAX_CACHED_CLIENTS:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(cache_key)
+            return client
+
+    def _invoke_signed(self, access_key: str, secret_key: str, region: str):
+        url = f"{self._endpoint(region)}/model/{urllib.parse.quote(self.MODEL_ID, safe='')}/invoke"
+        headers = sigv4.sign_request(
+            "POST",
+            url,
+            {"Content-Type": "application/json", "Accept": "application/json"},
+            self._serialized_request,
+            access_key,
+            secret_key,
+            region,
+            "bedrock",
+        )
+        request = urllib.request.Request(url, data=self._serialized_request, headers=headers, method="POST")
+        try:
+            with self._urlopen(request, timeout=10) as resp:
+                resp.read()
+        except urllib.error.HTTPError as err:
+            raw_body = self._extract_error_message(err)
+            try:
+                payload = json.loads(raw_body)
+            except ValueError:
+                payload = {}
+            if not isinstance(payload, dict):
+                payload = {}
+            # Error types arrive as "AccessDeniedException:http://..." in the header or "...#AccessDeniedException" in the body.
+            code = err.headers.get("x-amzn-ErrorType") or payload.get("__type") or ""
+            code = code.split(":", 1)[0].rsplit("#", 1)[-1].strip()
+            message = payload.get("message") or payload.get("Message") or raw_body
+            raise BedrockError(err.code, code, str(message)) from err
+
+    def _invoke_boto3(self, access_key: str, secret_key: str, region: str):
+        from botocore.exceptions import ClientError
+
+        governor = http_client.get_governor(urllib.parse.urlsplit(self._endpoint(region)).hostname or "")
+        client = self._client(access_key, secret_key, region)
+        governor.acquire()
+        try:
+            response = client.invoke_model(
+                modelId=self.MODEL_ID,
+                body=self._serialized_request,
+                contentType="application/json",
+                accept="application/json",
+            )
+        except ClientError as err:
+            metadata = err.response.get("ResponseMetadata", {})
+            governor.on_response(metadata.get("HTTPStatusCode") or 0, metadata.get("HTTPHeaders"))
+            metrics.upstream_requests.inc(self.get_name(), str(metadata.get("HTTPStatusCode") or "error"))
+            error = err.response.get("Error", {})
+            raise BedrockError(
+                metadata.get("HTTPStatusCode") or 0,
+                str(error.get("Code", "")).strip(),
+                str(error.get("Message") or ""),
+            ) from err
+        governor.on_response(200)
+        metrics.upstream_requests.inc(self.get_name(), "200")
+        body = response.get("body")
+        if hasattr(body, "read"):
+            body.read()
+
+    def _probe_region(self, access_key: str, secret_key: str, region: str):
+        # Returns (outcome, region, error); "skip" means this region says nothing about the key.
+        try:
+            if self._use_boto3:
+                self._invoke_boto3(access_key, secret_key, region)
+            else:
+                self._invoke_signed(access_key, secret_key, region)
+            return "verified", region, None
+        except BedrockError as err:
+            code = err.code
+            message = err.message.lower()
+            if code == "ResourceNotFoundException" or "model" in message and "not found" in message:
+                return "skip", region, err
+            if self._is_rate_limited(code, message):
+                return "rate_limited", region, err
+            if self._is_quota_reached(code, message):
+                return "quota", region, err
+            if self._is_invalid(code, message):
+                return "invalid", region, err
+            if self._is_denied(code, message):
+                return "denied", region, err
+            return "skip", region, err
+        except Exception as err:
+            return "skip", region, err
+
+    def _probe_regions(self, access_key: str, secret_key: str, regions: list[str], solo_first: bool = False):
+        # Regions are probed a small batch at a time, in order, and every batch is waited for in full: each successful
+        # probe is a billed call, so no more are started than can be used. Within a batch a success wins over anything
+        # else, and a denial in one region never ends the search, since another region may still work.
+        last_error: Exception | None = None
+        seen: dict[str, str] = {} # First region each outcome came from
+        # A region hint from the last verification usually answers on its own, so it goes first by itself.
+        size = 1 if solo_first else self._region_concurrency
+        start = 0
+        while start < len(regions):
+            batch = regions[start:start + size]
+            start += len(batch)
+            size = self._region_concurrency
+            futures = [self._region_executor.submit(self._probe_region, access_key, secret_key, region) for region in batch]
+            results = [future.result() for future in futures]
+            for outcome, region, error in results:
+                if error is not None:
+                    last_error = error
+                seen.setdefault(outcome, region)
+            # Throttles and quotas are retried later anyway, so they stop the search as well.
+            for outcome in ("verified", "invalid", "rate_limited", "quota"):
+                if outcome in seen:
+                    return outcome, seen[outcome], last_error
+        return "skip", None, last_error
 
-        self._handle_failure(serialized_key, access_key, secret_key, last_error, reverify)
+    def _flight_key(self, key: str | Sequence[str]) -> str:
+        try:
+            return self._normalize_input(key)[0]
+        except ValueError:
+            return str(key)
 
     def _normalize_input(self, key: str | Sequence[str]):
         if isinstance(key, str):
@@ -179,13 +348,6 @@ class AWSKeyChecker(KeyChecker):
         parts = serialized_key.split(":", 1)
         return parts[0], parts[1]
 
-    def _client_error_code(self, error: ClientError) -> str:
-        return str(error.response.get("Error", {}).get("Code", "")).strip()
-
-    def _client_error_message(self, error: ClientError) -> str:
-        message = error.response.get("Error", {}).get("Message") or ""
-        return str(message).lower()
-
     def _is_rate_limited(self, code: str, message: str) -> bool:
         return code in self.RATE_LIMIT_ERROR_CODES or "throttle" in message
 
@@ -195,18 +357,21 @@ class AWSKeyChecker(KeyChecker):
     def _is_invalid(self, code: str, message: str) -> bool:
         if code in self.INVALID_ERROR_CODES:
             return True
-        return "not authorized" in message or "invalid" in message
+        return "security token" in message or "signature" in message
+
+    def _is_denied(self, code: str, message: str) -> bool:
+        return code in self.DENIED_ERROR_CODES or "not authorized" in message or "invalid" in message
 
     def _handle_failure(self, serialized_key: str, access_key: str, secret_key: str, last_error: Exception | None, reverify: bool = False):
         if serialized_key not in self.keys:
             print("Not a valid AWS key", access_key, secret_key)
-            self.invalid_keys.append(serialized_key)
+            self.invalid_keys.add(serialized_key)
             return
         if self.keys[serialized_key] == "dead" and not reverify:
-            del self.keys[serialized_key]
+            self._delete_key(serialized_key)
             print("Deleted AWS key", access_key, secret_key, "because it is dead")
         else:
-            self.keys[serialized_key] = "dead"
+            self._set_key_status(serialized_key, "dead")
             print("Marked AWS key", access_key, secret_key, "as dead")
         self._save_keys()
         if last_error:
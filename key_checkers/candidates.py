@@ -0,0 +1,95 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+VERIFY = "verify"
+LOW_PRIORITY = "low_priority"
+DROP = "drop"
+LANES = (VERIFY, LOW_PRIORITY, DROP) # Best first
+
+# Words near a bare hex string that say it's a digest or an ID rather than a secret.
+HASH_WORDS = frozenset((
+    "md5", "sha", "sha1", "sha224", "sha256", "sha384", "sha512", "hash", "hashes", "checksum", "digest", "etag",
+    "integrity", "commit", "revision", "uuid", "guid", "fingerprint", "nonce",
+))
+# Context is compared word by word; "ELEVENLABS_API_KEY=" and "sha256:" come out as ["elevenlabs", "api", "key"]
+# and ["sha256"].
+WORD = re.compile(r"[a-z0-9]+")
+# Common inputs whose MD5 keeps turning up in logs, fixtures and docs.
+COMMON_INPUTS = (
+    "", " ", "\n", "0", "1", "a", "abc", "test", "testing", "example", "foo", "bar", "foobar", "hello", "hello world",
+    "password", "admin", "root", "user", "guest", "123456", "12345678", "123456789", "qwerty", "secret", "null",
+    "undefined", "none", "true", "false", "default", "changeme",
+)
+
+
+def _load_denylist(path: str | None) -> frozenset:
+    denylist = {hashlib.md5(value.encode("utf-8")).hexdigest() for value in COMMON_INPUTS}
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                denylist.update(line.strip().lower() for line in f if line.strip() and not line.startswith("#"))
+        except OSError as err:
+            print("Error loading candidate denylist", path, err)
+    return frozenset(denylist)
+
+
+_PLOGP = [0.0] + [count * math.log2(count) for count in range(1, 257)]
+
+
+def shannon_entropy(value: str) -> float:
+    # Bits per character; a random 32-character hex string averages about 3.5, a repeated pattern far less.
+    length = len(value)
+    if not length:
+        return 0.0
+    if length > 256:
+        return math.log2(length) - sum(count * math.log2(count) for count in Counter(value).values()) / length
+    return math.log2(length) - sum(_PLOGP[value.count(char)] for char in set(value)) / length
+
+
+# Decides, without touching the network, how likely a match is to be a real key: VERIFY goes to the ingest queue,
+# LOW_PRIORITY to a lane that only runs when nothing else is waiting, DROP nowhere. Scores start at 0.5 and move with
+# the words around the match; a denylisted or low-entropy string is dropped whatever its context.
+class CandidateFilter:
+    CONTEXT_CHARS = 64 # Characters on each side of a match looked at for keywords
+    MIN_ENTROPY = 2.5 # Below anything a random 32-character hex string realistically has
+
+    def __init__(self, keywords: tuple[str, ...], thresholds: tuple[float, float], denylist: frozenset = frozenset()):
+        self.keywords = frozenset(keyword.lower() for keyword in keywords)
+        self.drop_below, self.verify_from = thresholds
+        self.denylist = denylist
+
+    def score(self, text: str, start: int, end: int) -> float:
+        words = set(WORD.findall(text[max(start - self.CONTEXT_CHARS, 0):end + self.CONTEXT_CHARS].lower()))
+        score = 0.5
+        if not self.keywords.isdisjoint(words):
+            score += 0.5
+        # Named as a digest, or laid out like md5sum/sha1sum output ("<hash>  <file>").
+        if not HASH_WORDS.isdisjoint(words) or text[end:end + 2] == "  " and text[end + 2:end + 3].strip():
+            score -= 0.4
+        # Path segments and file names (".../3f2a...9c.png") are almost always content hashes.
+        if text[start - 1:start] == "/" or text[end:end + 1] == "." and text[end + 1:end + 2].isalnum():
+            score -= 0.2
+        return score
+
+    def lane(self, text: str, start: int, end: int, key: str) -> str:
+        if key.lower() in self.denylist:
+            return DROP
+        score = self.score(text, start, end)
+        # The entropy is only worked out for matches the context didn't already rule out.
+        if score < self.drop_below or shannon_entropy(key) < self.MIN_ENTROPY:
+            return DROP
+        return VERIFY if score >= self.verify_from else LOW_PRIORITY
+
+
+_denylist: frozenset | None = None
+
+
+def get_denylist() -> frozenset:
+    # Shared by every checker; NEKEE_CANDIDATE_DENYLIST names a file of extra hashes, one per line.
+    global _denylist
+    if _denylist is None:
+        _denylist = _load_denylist(os.getenv("NEKEE_CANDIDATE_DENYLIST"))
+    return _denylist
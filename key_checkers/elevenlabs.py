@@ -13,74 +13,61 @@ import urllib.request
 
 
 class ElevenLabsKeyChecker(KeyChecker):
-    VERIFY_ENDPOINT = "https://api.elevenlabs.io/v1/models"
-    PROFILE_ENDPOINT = "https://api.elevenlabs.io/v1/user"
+    API_BASE_URL = "https://api.elevenlabs.io"
+    LIVENESS_PATH = "/v1/models"
+    PROFILE_PATH = "/v1/user"
+    KEY_PREFIXES = ("sk_",)
+    HIGH_TIERS = ("pro", "scale", "business")
+    CANDIDATE_KEYWORDS = ("elevenlabs", "eleven", "11labs", "xi", "tts", "voice")
+    CANDIDATE_THRESHOLDS = (0.2, 0.6) # A bare hex string with no context at all goes to the low-priority lane
 
     def get_regex_pattern(self) -> str:
         return r"sk_[a-f0-9]{48}|(?<![A-Za-z0-9])[a-f0-9]{32}(?![A-Za-z0-9])"
 
-    def _fetch_subscription_tier(self, key: str) -> str:
-        request = urllib.request.Request(
-            self.PROFILE_ENDPOINT,
-            headers={
-                "xi-api-key": key,
-                "Accept": "application/json",
-            },
-            method="GET",
-        )
-        try:
-            with urllib.request.urlopen(request, timeout=10) as response:
-                return json.loads(response.read().decode("utf-8")).get("subscription").get("tier")
-        except Exception as e:
-            print("Error fetching subscription tier for key", key, e)
-            return "unknown"
+    def get_unprefixed_pattern(self) -> str | None:
+        # Legacy keys are bare 32-hex strings with no literal prefix to anchor on.
+        return r"(?<![A-Za-z0-9])[a-f0-9]{32}(?![A-Za-z0-9])"
+
+    def _is_ambiguous(self, key: str) -> bool:
+        # Only legacy keys; a bare 32-hex string is just as often an MD5 or an ID.
+        return not key.startswith("sk_")
 
-    def verify_key(self, key: str, reverify: bool = False):
-        if key in self.invalid_keys:
-            return
+    def _auth_headers(self, key: str) -> dict[str, str]:
+        return {"xi-api-key": key, "Accept": "application/json"}
 
+    def enrich_key(self, key: str):
         request = urllib.request.Request(
-            self.VERIFY_ENDPOINT,
-            headers={
-                "xi-api-key": key,
-                "Accept": "application/json",
-            },
+            self.api_base_url + self.PROFILE_PATH,
+            headers=self._auth_headers(key),
             method="GET",
         )
-
         try:
-            with urllib.request.urlopen(request, timeout=10) as resp:
-                if resp.status >= 400:
-                    raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, resp.read())
-                tier = self._fetch_subscription_tier(key)
-                self.keys[key] = tier
-                print("Verified key", key, "with tier", tier)
-                self._save_keys()
-                return True
+            with self._urlopen(request, timeout=10) as response:
+                body = response.read()
+                if response.status >= 400:
+                    raise urllib.error.HTTPError(response.url, response.status, response.reason, response.headers, body)
+                tier = json.loads(body.decode("utf-8")).get("subscription").get("tier")
         except urllib.error.HTTPError as err:
-            if err.code == 429 or err.code == 400:
+            if err.code != 429:
+                # Keys scoped without user access are refused here but still work, so they're kept with no tier.
+                print("Error fetching subscription tier for key", key, err)
+                tier = "unknown"
+            else:
                 error_message = self._extract_error_message(err).lower()
                 print("Error message:", error_message)
-                if "quota" in error_message or "exhausted" in error_message or "credit" in error_message:
+                if self._quota_exhausted(error_message):
                     print("Monthly usage reached for key", key)
-                    self.monthly_usage_reached_keys.add(key)
-                elif "rate" in error_message or "large" in error_message:
-                    print("Rate limit reached for key", key, "- retrying in 10 minutes")
-                    self.keys[key] = "rate_limited"
-                    self._schedule_retry(key)
-                    self._save_keys()
+                    self._mark_monthly_usage_reached(key)
                     return
-
-            if key not in self.keys:
-                print("Not a valid key", key)
-                self.invalid_keys.append(key)
+                print("Rate limit reached for key", key, "- retrying in 10 minutes")
+                self._set_key_status(key, "rate_limited")
+                self._schedule_retry(key)
+                self._save_keys()
                 return
-            if self.keys[key] == "dead" and not reverify:
-                del self.keys[key]
-                print("Deleted key", key, "because it is dead")
-            else:
-                self.keys[key] = "dead"
-                print("Marked key", key, "as dead")
-            self._save_keys()
-
-
+        except Exception as e:
+            print("Error fetching subscription tier for key", key, e)
+            tier = "unknown"
+        self._set_key_status(key, tier)
+        print("Verified key", key, "with tier", tier)
+        self._save_keys()
+        return True
@@ -0,0 +1,80 @@
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+
+# Tier and feature lookups for keys that already passed their liveness check. They run on a small pool of their own
+# and hold back while verifications are waiting for a worker, so the slow and often billed calls never hold up ingest.
+# A key is only queued once, however often it's asked for before its turn comes.
+class EnrichmentQueue:
+    NAME = "enrich"
+
+    def __init__(self, concurrency: int = 2, busy: Callable[[], bool] = lambda: False, max_yield: float = 5.0, max_depth: int = 0):
+        self.concurrency = concurrency
+        self.busy = busy
+        self.max_yield = max_yield # Longest an enrichment waits for verifications, so a steady stream can't starve it
+        self.max_depth = max_depth # Jobs queued at most, 0 for no limit
+        self._queue: deque = deque()
+        self._queued: set[tuple[str, str]] = set()
+        self._running = 0
+        self._condition = threading.Condition()
+        self._threads: list[threading.Thread] = []
+
+    def submit(self, checker, key) -> bool:
+        # False when the queue is full and the job was turned away.
+        entry = (checker.get_name(), checker._flight_key(key))
+        with self._condition:
+            if entry in self._queued:
+                return True
+            if self.max_depth and len(self._queue) >= self.max_depth:
+                return False
+            self._queued.add(entry)
+            self._queue.append((entry, checker, key))
+            if not self._threads:
+                for index in range(self.concurrency):
+                    thread = threading.Thread(target=self._run, name=f"{self.NAME}-{index}", daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+            self._condition.notify()
+        return True
+
+    def depth(self) -> int:
+        return len(self._queued) - self._running
+
+    def running(self) -> int:
+        return self._running
+
+    def _yield_to_verifications(self):
+        deadline = time.monotonic() + self.max_yield
+        while self.busy() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                entry, checker, key = self._queue.popleft()
+                self._running += 1
+            try:
+                self._yield_to_verifications()
+                self._work(checker, key)
+            except Exception as err:
+                print("Error in", self.NAME, "job for key", key, err)
+            finally:
+                with self._condition:
+                    self._queued.discard(entry)
+                    self._running -= 1
+
+    def _work(self, checker, key):
+        checker.enrich(key)
+
+
+# Matches that scored too low to verify right away (see CandidateFilter). They're verified one at a time, only while
+# no verification or enrichment is waiting, and are not kept across restarts.
+class LowPriorityLane(EnrichmentQueue):
+    NAME = "low-priority"
+
+    def _work(self, checker, key):
+        checker.verify(key)
@@ -13,6 +13,10 @@ import urllib.request
 
 
 class GoogleKeyChecker(KeyChecker):
+    API_BASE_URL = "https://generativelanguage.googleapis.com"
+    LIVENESS_PATH = "/v1beta/models"
+    KEY_PREFIXES = ("AIza",)
+    HIGH_TIERS = ("tier_2", "tier_3")
     TIER_BY_LIMITS = { # For gemini-2.5-flash-lite
         (15, 250_000): "Free",
         (4_000, 4_000_000): "Tier_1",
@@ -23,29 +27,31 @@ class GoogleKeyChecker(KeyChecker):
     def get_regex_pattern(self) -> str:
         return r"AIza[0-9A-Za-z\-_]{35}"
 
+    def _quota_exhausted(self, error_message: str) -> bool:
+        # "Quota exceeded for ... per minute" is a rate limit; only an exhausted balance lasts the month.
+        return ("exhausted" in error_message or "credit" in error_message) and ("per" not in error_message)
+
     def _tier_from_headers(self, headers) -> str:
         # Gemini API doesn't return any headers for rate limiting yet.
         return "unknown"
 
-    def verify_key(self, key: str, reverify: bool = False):
-        if key in self.invalid_keys:
-            return
+    def _auth_headers(self, key: str) -> dict[str, str]:
+        return {"x-goog-api-key": key}
 
+    def enrich_key(self, key: str):
+        # There's no tier to read yet, but only a generation tells whether the key has quota left.
         req = urllib.request.Request(
-            "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-lite:generateContent",
+            f"{self.api_base_url}/v1beta/models/gemini-2.5-flash-lite:generateContent",
             data=json.dumps({"contents": [{"parts": [{"text": "Just say \"a\""}]}]}).encode("utf-8"),
-            headers={
-                "x-goog-api-key": key,
-                "Content-Type": "application/json",
-            },
+            headers={**self._auth_headers(key), "Content-Type": "application/json"},
             method="POST",
         )
 
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with self._urlopen(req, timeout=10) as resp:
                 if resp.status >= 400:
                     raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, resp.read())
-                self.keys[key] = self._tier_from_headers(resp.headers)
+                self._set_key_status(key, self._tier_from_headers(resp.headers))
                 print("Verified key", key, "with tier", self.keys[key])
                 self._save_keys()
                 return True
@@ -53,27 +59,17 @@ class GoogleKeyChecker(KeyChecker):
             if err.code == 429 or err.code == 400:
                 error_message = self._extract_error_message(err).lower()
                 print("Error message:", error_message)
-                if ("exhausted" in error_message or "credit" in error_message) and ("per" not in error_message):
+                if self._quota_exhausted(error_message):
                     print("Monthly usage reached for key", key)
-                    self.monthly_usage_reached_keys.add(key)
+                    self._mark_monthly_usage_reached(key)
+                    return
                 elif "quota" in error_message or "rate" in error_message or "large" in error_message or "minute" in error_message:
                     print("Rate limit reached for key", key, "- retrying in 10 minutes")
-                    self.keys[key] = "rate_limited"
+                    self._set_key_status(key, "rate_limited")
                     self._schedule_retry(key)
                     self._save_keys()
                     return
 
-            if key not in self.keys:
-                print("Not a valid key", key)
-                self.invalid_keys.append(key)
-                return
-            if not reverify:
-                if self.keys[key] == "dead":
-                    del self.keys[key]
-                    print("Deleted key", key, "because it is dead")
-                else:
-                    self.keys[key] = "dead"
-                    print("Marked key", key, "as dead")
-            self._save_keys()
+            self._mark_failed(key)
 
 
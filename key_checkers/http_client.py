@@ -0,0 +1,154 @@
+import http.client
+import io
+import os
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Callable
+
+try:
+    from .rate_governor import RateGovernor
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.rate_governor import RateGovernor
+
+
+class PooledResponse:
+    def __init__(self, url: str, status: int, reason: str, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._body = body
+
+    def read(self) -> bytes:
+        return self._body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, max_idle_per_host: int = 16):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    def _origin(self, url: str) -> tuple[str, str, int]:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, parts.hostname or "", port
+
+    def _acquire(self, origin: tuple[str, str, int], timeout: float):
+        with self._lock:
+            idle = self._idle.get(origin)
+            if idle:
+                conn = idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        scheme, host, port = origin
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _release(self, origin: tuple[str, str, int], conn: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(origin, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def urlopen(self, request: urllib.request.Request, timeout: float = 10, key_limited: Callable[[int, bytes], bool] | None = None) -> PooledResponse:
+        # `key_limited` tells a 429 about one key's quota apart from the host throttling us; only the latter slows the
+        # host down.
+        url = request.full_url
+        origin = self._origin(url)
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        headers = dict(request.header_items())
+        governor = get_governor(origin[1])
+        governor.acquire()
+
+        # An idle keep-alive connection may have been closed by the server, so a reused one gets a second chance.
+        for attempt in range(2):
+            conn, reused = self._acquire(origin, timeout)
+            try:
+                conn.request(request.get_method(), path, body=request.data, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as err:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise urllib.error.URLError(err) from err
+            except TimeoutError:
+                conn.close()
+                raise
+            except (OSError, http.client.HTTPException) as err:
+                conn.close()
+                raise urllib.error.URLError(err) from err
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(origin, conn)
+            break
+
+        if key_limited is None or not key_limited(resp.status, body):
+            governor.on_response(resp.status, resp.msg)
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.msg, io.BytesIO(body))
+        return PooledResponse(url, resp.status, resp.reason, resp.msg, body)
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(int(os.getenv("NEKEE_HTTP_POOL_SIZE", "16")))
+    return _pool
+
+
+def urlopen(request: urllib.request.Request, timeout: float = 10, key_limited: Callable[[int, bytes], bool] | None = None) -> PooledResponse:
+    return get_pool().urlopen(request, timeout=timeout, key_limited=key_limited)
+
+
+_governors: dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def _host_rate(host: str) -> float:
+    # NEKEE_HOST_RATES overrides the default per host, e.g. "api.openai.com=20,api.anthropic.com=5".
+    for entry in os.getenv("NEKEE_HOST_RATES", "").split(","):
+        name, _, rate = entry.partition("=")
+        if name.strip() == host and rate.strip():
+            return float(rate)
+    return float(os.getenv("NEKEE_HOST_RATE", "10"))
+
+
+def get_governor(host: str) -> RateGovernor:
+    governor = _governors.get(host)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(host)
+            if governor is None:
+                rate = _host_rate(host)
+                governor = _governors[host] = RateGovernor(rate, burst=max(rate * 2, 1))
+    return governor
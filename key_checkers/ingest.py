@@ -0,0 +1,243 @@
+import asyncio
+import gzip
+import io
+import json
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from typing import BinaryIO, Iterable, Iterator
+
+from fastapi import HTTPException
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from .scanner import StreamingScan
+except ImportError:
+    import os
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.scanner import StreamingScan
+
+TAR_TYPES = ("application/x-tar", "application/tar", "application/x-gtar")
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+GZIP_TYPES = ("application/gzip", "application/x-gzip")
+ZSTD_TYPES = ("application/zstd",)
+
+
+# Hands request body chunks from the event loop to the thread that decodes and scans them, holding at most
+# `capacity` chunks so a slow scan pushes back on the upload instead of buffering it. The event loop side waits on an
+# asyncio.Event rather than a thread, so a stalled scan never ties up the default executor.
+class ChunkPipe:
+    def __init__(self, loop: asyncio.AbstractEventLoop, capacity: int = 4):
+        self._loop = loop
+        self._chunks: deque[bytes] = deque()
+        self._capacity = capacity
+        self._condition = threading.Condition()
+        self._space = asyncio.Event()
+        self._finished = False
+        self._closed = False
+
+    async def put(self, chunk: bytes) -> bool:
+        # Returns False once the reader has stopped, so the writer can stop reading the request too.
+        while True:
+            with self._condition:
+                if self._closed:
+                    return False
+                if len(self._chunks) < self._capacity:
+                    self._chunks.append(chunk)
+                    self._condition.notify_all()
+                    return True
+                self._space.clear()
+            await self._space.wait()
+
+    def _signal_space(self):
+        self._loop.call_soon_threadsafe(self._space.set)
+
+    def finish(self):
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._chunks.clear()
+            self._condition.notify_all()
+        self._signal_space()
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            with self._condition:
+                while not self._chunks and not self._finished and not self._closed:
+                    self._condition.wait()
+                if not self._chunks:
+                    return
+                chunk = self._chunks.popleft()
+            self._signal_space()
+            yield chunk
+
+
+class _IterReader(io.RawIOBase):
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+# Fails with a 413 as soon as more than `limit` decoded bytes have been read, whoever is reading them (a tar or zip
+# reader, the NDJSON line splitter or the plain text scan).
+class _LimitedReader(io.RawIOBase):
+    def __init__(self, raw: BinaryIO, limit: int):
+        self._raw = raw
+        self._limit = limit
+        self._read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = self._raw.readinto(buffer)
+        self._read += size or 0
+        if self._read > self._limit:
+            raise HTTPException(status_code=413, detail="decoded body is too large")
+        return size
+
+
+def _decompress(body: BinaryIO, coding: str) -> BinaryIO:
+    if coding in ("gzip", "x-gzip"):
+        return gzip.GzipFile(fileobj=body, mode="rb")
+    if coding == "zstd":
+        if zstandard is None:
+            raise HTTPException(status_code=415, detail="zstd bodies need the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True)
+    if coding in ("", "identity"):
+        return body
+    raise HTTPException(status_code=415, detail=f"unsupported content encoding {coding}")
+
+
+def _read_chunks(f: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _rest_of_line(body: BinaryIO, first: bytes, chunk_size: int) -> Iterator[bytes]:
+    yield first
+    while True:
+        piece = body.readline(chunk_size)
+        if not piece:
+            return
+        yield piece
+        if piece.endswith(b"\n"):
+            return
+
+
+def _strings(value) -> Iterator[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def iter_documents(body: BinaryIO, media_type: str, chunk_size: int) -> Iterator[Iterator[bytes]]:
+    # Yields each document as an iterator of byte chunks. Every document has to be read to the end before asking for
+    # the next one, since tar members are only readable while the stream is positioned on them.
+    if media_type in TAR_TYPES:
+        # "r|*" reads the archive as a stream and also unpacks .tar.gz/.tar.bz2/.tar.xz on its own.
+        with tarfile.open(fileobj=body, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield _read_chunks(archive.extractfile(member), chunk_size)
+    elif media_type in ZIP_TYPES:
+        # The central directory is at the end, so a zip has to be spooled before it can be read.
+        with tempfile.SpooledTemporaryFile(max_size=chunk_size * 8) as spool:
+            shutil.copyfileobj(body, spool, chunk_size)
+            with zipfile.ZipFile(spool) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or info.flag_bits & 0x1: # Encrypted members can't be read without a password
+                        continue
+                    with archive.open(info) as member:
+                        yield _read_chunks(member, chunk_size)
+    elif media_type in NDJSON_TYPES:
+        while True:
+            line = body.readline(chunk_size)
+            if not line:
+                return
+            if len(line) == chunk_size and not line.endswith(b"\n"):
+                # Too long to parse as one record; the rest of the line is scanned as plain text, a chunk at a time.
+                yield _rest_of_line(body, line, chunk_size)
+                continue
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                document = json.loads(line)
+            except ValueError:
+                # A line that isn't JSON is still worth scanning as plain text.
+                yield iter((line,))
+                continue
+            yield iter(("\n".join(_strings(document)).encode("utf-8"),))
+    else:
+        yield _read_chunks(body, chunk_size)
+
+
+def scan_body(scan: StreamingScan, chunks: Iterable[bytes], content_encoding: str, content_type: str, chunk_size: int, max_size: int) -> int:
+    # Decodes a /data body as it arrives and feeds every document in it to `scan`, each one scanned on its own so a
+    # match never spans two documents. Returns the number of decoded bytes scanned.
+    body: BinaryIO = io.BufferedReader(_IterReader(chunks), chunk_size)
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    try:
+        # Codings are listed in the order they were applied, so they're undone from the last one.
+        for coding in reversed([coding.strip().lower() for coding in content_encoding.split(",") if coding.strip()]):
+            body = _decompress(body, coding)
+        if media_type in GZIP_TYPES or media_type in ZSTD_TYPES:
+            body = _decompress(body, "gzip" if media_type in GZIP_TYPES else "zstd")
+            media_type = "text/plain"
+        body = io.BufferedReader(_LimitedReader(body, max_size), chunk_size)
+
+        scanned = 0
+        for document in iter_documents(body, media_type, chunk_size):
+            for chunk in document:
+                scanned += len(chunk)
+                if scanned > max_size:
+                    raise HTTPException(status_code=413, detail="decoded body is too large")
+                scan.feed(chunk)
+            scan.feed(b"", final=True)
+        return scanned
+    except HTTPException:
+        raise
+    except (OSError, EOFError, ValueError, zlib.error, tarfile.TarError, zipfile.BadZipFile) as err:
+        raise HTTPException(status_code=400, detail=f"could not decode body: {err}")
+    except Exception as err:
+        if zstandard is not None and isinstance(err, zstandard.ZstdError):
+            raise HTTPException(status_code=400, detail=f"could not decode body: {err}")
+        raise
@@ -0,0 +1,304 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import as_completed
+
+try:
+    from .key_checker import _get_verify_executor
+    from .shared_store import SharedDatabase
+except ImportError:
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.key_checker import _get_verify_executor
+    from key_checkers.shared_store import SharedDatabase
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("ingest queue is full")
+        self.retry_after = retry_after
+
+
+# The queue's file on disk: an append-only log of "add" and "done" records, rewritten with just the pending batches
+# once it holds twice as many records as there are batches left.
+class FileQueueLog:
+    COMPACT_MIN_RECORDS = 1000
+
+    def __init__(self, path: str, fsync_interval: float = 1.0):
+        self.path = path
+        self.sync_interval = fsync_interval
+        self._next_id = 1
+        self._records = 0
+        self._dirty = False
+        self._file = None
+
+    def load(self) -> list[tuple[int, dict]]:
+        pending: OrderedDict[int, dict] = OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._records += 1
+                    try:
+                        record = json.loads(line)
+                        batch_id = int(record["id"])
+                    except (ValueError, KeyError, TypeError):
+                        # A crash mid-append leaves a torn last line; everything before it is still good.
+                        continue
+                    self._next_id = max(self._next_id, batch_id + 1)
+                    if record.get("op") == "add":
+                        pending[batch_id] = {"reverify": bool(record.get("reverify")), "keys": record.get("keys") or {}}
+                    elif record.get("op") == "done":
+                        pending.pop(batch_id, None)
+        except FileNotFoundError:
+            pass
+        if self._records > len(pending):
+            self._rewrite(pending)
+        self._file = open(self.path, "a", encoding="utf-8")
+        return list(pending.items())
+
+    def _rewrite(self, pending: dict[int, dict]):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for batch_id, batch in pending.items():
+                f.write(_encode({"op": "add", "id": batch_id, **batch}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._records = len(pending)
+
+    def _append(self, record: dict):
+        # Handed to the OS right away so a crashed process loses nothing; the fsync is batched by sync().
+        self._file.write(_encode(record))
+        self._file.flush()
+        self._records += 1
+        self._dirty = True
+
+    def add(self, batch: dict) -> int:
+        batch_id = self._next_id
+        self._next_id += 1
+        self._append({"op": "add", "id": batch_id, **batch})
+        return batch_id
+
+    def done(self, batch_id: int, pending: dict[int, dict]):
+        self._append({"op": "done", "id": batch_id})
+        if self._records >= max(2 * len(pending), self.COMPACT_MIN_RECORDS):
+            self._file.close()
+            self._rewrite(pending)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._dirty = False
+
+    def sync(self):
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def adopt(self) -> list[tuple[int, dict]]:
+        return []
+
+
+# The queue's rows in the shared database. Each process works on the batches it accepted; batches left behind by a
+# process whose liveness lease ran out are adopted by the next process to look.
+class SqliteQueueLog:
+    def __init__(self, database: SharedDatabase):
+        self.database = database
+        self.sync_interval = database.lease_ttl / 3 # How often orphaned batches are looked for
+
+    def load(self) -> list[tuple[int, dict]]:
+        return self.adopt()
+
+    def add(self, batch: dict) -> int:
+        return self.database.connection().execute(
+            "INSERT INTO ingest (owner, batch) VALUES (?, ?)", (self.database.owner, _encode(batch))
+        ).lastrowid
+
+    def done(self, batch_id: int, pending: dict[int, dict]):
+        self.database.connection().execute("DELETE FROM ingest WHERE id = ?", (batch_id,))
+
+    def sync(self):
+        pass
+
+    def adopt(self) -> list[tuple[int, dict]]:
+        conn = self.database.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, batch FROM ingest WHERE owner NOT IN "
+                "(SELECT substr(name, 9) FROM leases WHERE name LIKE 'process:%' AND expires_at > ?) ORDER BY id",
+                (now,),
+            ).fetchall()
+            conn.executemany("UPDATE ingest SET owner = ? WHERE id = ?", [(self.database.owner, row[0]) for row in rows])
+            conn.execute("DELETE FROM leases WHERE name LIKE 'process:%' AND expires_at < ?", (now,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        batches = []
+        for batch_id, batch in rows:
+            batch = json.loads(batch)
+            batches.append((batch_id, {"reverify": bool(batch.get("reverify")), "keys": batch.get("keys") or {}}))
+        return batches
+
+
+def _encode(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+# Keys found in /data bodies wait here until a worker has verified them, kept in `log` so work accepted before a
+# crash or restart is picked up again.
+class IngestQueue:
+    RATE_WINDOW = 60.0 # Seconds of finished batches the drain rate behind Retry-After is measured over
+    RETRY_DELAY = 30.0 # Seconds a worker waits before putting back a batch that failed, so a lasting fault doesn't spin
+
+    def __init__(self, log: FileQueueLog | SqliteQueueLog, checkers, max_batches: int = 10_000, max_keys: int = 100_000, workers: int = 4):
+        self.log = log
+        self.checkers = {checker.get_name(): checker for checker in checkers}
+        self.max_batches = max_batches
+        self.max_keys = max_keys
+        self.workers = workers
+        self._pending: OrderedDict[int, dict] = OrderedDict() # Every unfinished batch, including the ones being worked on
+        self._waiting: deque[int] = deque() # Batches no worker has picked up yet
+        self._keys = 0
+        self._running = 0
+        self._finished: deque[tuple[float, int]] = deque() # (monotonic time, keys) of recently finished batches
+        self._condition = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._take(self.log.load())
+        if self._pending:
+            print("Resuming", len(self._pending), "ingest batches with", self._keys, "keys")
+
+    def _take(self, batches: list[tuple[int, dict]]):
+        with self._condition:
+            for batch_id, batch in batches:
+                if batch_id in self._pending:
+                    continue
+                self._pending[batch_id] = batch
+                self._waiting.append(batch_id)
+                self._keys += self._count(batch["keys"])
+            self._condition.notify_all()
+
+    def _count(self, keys: dict) -> int:
+        return sum(len(matches) for matches in keys.values())
+
+    def full(self) -> bool:
+        return len(self._pending) >= self.max_batches or self._keys >= self.max_keys
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def pending_keys(self) -> int:
+        return self._keys
+
+    def running(self) -> int:
+        return self._running
+
+    def retry_after(self) -> int:
+        # How long the keys already queued take to drain at the rate batches finished lately.
+        with self._condition:
+            now = time.monotonic()
+            while self._finished and now - self._finished[0][0] > self.RATE_WINDOW:
+                self._finished.popleft()
+            finished = sum(keys for _, keys in self._finished)
+            if not finished:
+                return 30
+            rate = finished / max(now - self._finished[0][0], 1.0)
+            return min(max(math.ceil(self._keys / rate), 1), 300)
+
+    def put(self, found: dict, reverify: bool = False) -> int | None:
+        # Takes {checker: matches} from a scan and keeps only the keys worth verifying. Returns the batch id, or None
+        # when nothing needs verifying; raises QueueFull when there's no room for the batch.
+        keys = {}
+        for checker, matches in found.items():
+            selected = {match: None for match in checker._keys_to_verify(matches, reverify)}
+            if selected:
+                keys[checker.get_name()] = [list(match) if isinstance(match, tuple) else match for match in selected]
+        count = self._count(keys)
+        if not count:
+            return None
+        with self._condition:
+            # A batch bigger than the whole limit is still taken when the queue is empty, or it could never get in.
+            if self._pending and (len(self._pending) >= self.max_batches or self._keys + count > self.max_keys):
+                raise QueueFull(self.retry_after())
+            batch_id = self.log.add({"reverify": reverify, "keys": keys})
+            self._pending[batch_id] = {"reverify": reverify, "keys": keys}
+            self._waiting.append(batch_id)
+            self._keys += count
+            self._condition.notify()
+        return batch_id
+
+    def start(self):
+        with self._condition:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                self._threads.append(threading.Thread(target=self._work, name=f"ingest-{index}", daemon=True))
+            self._threads.append(threading.Thread(target=self._sync, name="ingest-sync", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._waiting:
+                    self._condition.wait()
+                batch_id = self._waiting.popleft()
+                batch = self._pending[batch_id]
+                self._running += 1
+            try:
+                self._process(batch)
+            except Exception as err:
+                # The batch stays in the log and goes to the back of the queue; its keys are only done once verified.
+                print("Error processing ingest batch", batch_id, err, "- retrying in", self.RETRY_DELAY, "seconds")
+                with self._condition:
+                    self._running -= 1
+                time.sleep(self.RETRY_DELAY)
+                with self._condition:
+                    self._waiting.append(batch_id)
+                    self._condition.notify()
+                continue
+            self._finish(batch_id)
+
+    def _process(self, batch: dict):
+        # Runs on the shared verify executor, so queued batches count against NEKEE_VERIFY_CONCURRENCY like every
+        # other verification. The keys are filtered again since another batch may have verified them meanwhile.
+        executor = _get_verify_executor()
+        reverify = batch["reverify"]
+        futures = {}
+        for name, matches in batch["keys"].items():
+            checker = self.checkers.get(name)
+            if checker is None:
+                continue
+            matches = [tuple(match) if isinstance(match, list) else match for match in matches]
+            for key in checker._keys_to_verify(matches, reverify):
+                futures[executor.submit(checker.verify, key, reverify)] = key
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as err:
+                print("Error verifying key", futures[future], err)
+
+    def _finish(self, batch_id: int):
+        with self._condition:
+            batch = self._pending.pop(batch_id)
+            count = self._count(batch["keys"])
+            self._keys -= count
+            self._running -= 1
+            self._finished.append((time.monotonic(), count))
+            try:
+                self.log.done(batch_id, self._pending)
+            except Exception as err:
+                print("Error persisting ingest batch", batch_id, err)
+
+    def _sync(self):
+        while True:
+            time.sleep(self.log.sync_interval)
+            try:
+                with self._condition:
+                    self.log.sync()
+                self._take(self.log.adopt())
+            except Exception as err:
+                print("Error persisting ingest queue", err)
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+from typing import Callable
+
+
+# Snapshot file plus an append-only journal of the changes made since it was written.
+class KeyJournal:
+    def __init__(self, snapshot_path: str, fsync_interval: float = 1.0, compact_after: int = 10_000, compact_interval: float = 600.0):
+        self.snapshot_path = snapshot_path
+        self.journal_path = os.path.splitext(snapshot_path)[0] + ".journal"
+        self.rotated_path = self.journal_path + ".old"
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._dirty = False
+        self._records_since_compaction = 0
+        self._last_compaction = time.monotonic()
+        self._snapshot_fn: Callable[[], dict] | None = None
+        self._wakeup = threading.Event()
+
+    def _read_records(self, path: str) -> list[dict]:
+        records = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A crash mid-append leaves a torn last line; everything before it is still good.
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def load(self) -> tuple[dict | None, list[dict]]:
+        snapshot = None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            pass
+        # A rotated journal only survives if compaction was interrupted; replaying it again is harmless.
+        records = self._read_records(self.rotated_path) + self._read_records(self.journal_path)
+        self._records_since_compaction = len(records)
+        return snapshot, records
+
+    def start(self, snapshot_fn: Callable[[], dict]):
+        self._snapshot_fn = snapshot_fn
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+        thread = threading.Thread(target=self._run, name=f"journal-{os.path.basename(self.journal_path)}", daemon=True)
+        thread.start()
+
+    def append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self._records_since_compaction += 1
+
+    def flush(self):
+        # Hands buffered records to the OS right away; the fsync is batched by the background thread.
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            self._dirty = True
+        if self._records_since_compaction >= self.compact_after:
+            self._wakeup.set()
+
+    def _fsync(self):
+        with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def compact(self):
+        if self._snapshot_fn is None:
+            return
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.journal_path, self.rotated_path)
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+            self._dirty = False
+            self._records_since_compaction = 0
+            self._last_compaction = time.monotonic()
+        # State is changed before its record is appended, so a snapshot taken after the rotation covers every
+        # record in the rotated journal.
+        data = self._snapshot_fn()
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        os.remove(self.rotated_path)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.fsync_interval)
+            self._wakeup.clear()
+            try:
+                self._fsync()
+                if self._records_since_compaction >= self.compact_after or (
+                    self._records_since_compaction
+                    and time.monotonic() - self._last_compaction >= self.compact_interval
+                ):
+                    self.compact()
+            except Exception as err:
+                print("Error persisting", self.journal_path, err)
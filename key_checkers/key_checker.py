@@ -1,112 +1,628 @@
 from abc import ABC, abstractmethod
-import random
+from concurrent.futures import Future, ThreadPoolExecutor
+import time
 import re
 import os
-import json
 import threading
 import urllib
 import urllib.error
+import urllib.request
+from typing import Callable
 
 from fastapi import HTTPException
 
+try:
+    from . import http_client, metrics
+    from .candidates import VERIFY, CandidateFilter, get_denylist
+    from .enrichment import EnrichmentQueue, LowPriorityLane
+    from .journal import KeyJournal
+    from .key_store import KeySnapshot, KeyStore
+    from .negative_cache import NegativeCache
+    from .retry_scheduler import get_retry_scheduler
+    from .shared_store import SqliteJournal, SqliteNegativeCache, get_database, get_lease
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers import http_client, metrics
+    from key_checkers.candidates import VERIFY, CandidateFilter, get_denylist
+    from key_checkers.enrichment import EnrichmentQueue, LowPriorityLane
+    from key_checkers.journal import KeyJournal
+    from key_checkers.key_store import KeySnapshot, KeyStore
+    from key_checkers.negative_cache import NegativeCache
+    from key_checkers.retry_scheduler import get_retry_scheduler
+    from key_checkers.shared_store import SqliteJournal, SqliteNegativeCache, get_database, get_lease
+
+_verify_executor: ThreadPoolExecutor | None = None
+_verify_executor_lock = threading.Lock()
+
+
+def _get_verify_executor() -> ThreadPoolExecutor:
+    # Shared by every checker so NEKEE_VERIFY_CONCURRENCY caps the total number of verifications in flight.
+    global _verify_executor
+    if _verify_executor is None:
+        with _verify_executor_lock:
+            if _verify_executor is None:
+                _verify_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("NEKEE_VERIFY_CONCURRENCY", "16")),
+                    thread_name_prefix="verify",
+                )
+    return _verify_executor
+
+
+def verify_queue_depth() -> int:
+    # Verifications submitted to the shared executor that haven't started yet.
+    return _verify_executor._work_queue.qsize() if _verify_executor is not None else 0
+
+
+_enrichment_queue: EnrichmentQueue | None = None
+
+
+def get_enrichment_queue() -> EnrichmentQueue:
+    # Shared by every checker; it gives way whenever verifications are waiting for the verify executor.
+    global _enrichment_queue
+    if _enrichment_queue is None:
+        with _verify_executor_lock:
+            if _enrichment_queue is None:
+                _enrichment_queue = EnrichmentQueue(
+                    concurrency=int(os.getenv("NEKEE_ENRICH_CONCURRENCY", "2")),
+                    busy=lambda: verify_queue_depth() > 0,
+                )
+    return _enrichment_queue
+
+
+_low_priority_lane: LowPriorityLane | None = None
+
+
+def get_low_priority_lane() -> LowPriorityLane:
+    # Low-confidence candidates wait here for as long as verifications or enrichments are queued ahead of them.
+    global _low_priority_lane
+    if _low_priority_lane is None:
+        with _verify_executor_lock:
+            if _low_priority_lane is None:
+                _low_priority_lane = LowPriorityLane(
+                    concurrency=int(os.getenv("NEKEE_LOW_PRIORITY_CONCURRENCY", "1")),
+                    busy=lambda: verify_queue_depth() > 0 or get_enrichment_queue().depth() > 0,
+                    max_yield=60.0,
+                    max_depth=int(os.getenv("NEKEE_LOW_PRIORITY_QUEUE_SIZE", "10000")),
+                )
+    return _low_priority_lane
+
+
+def storage_path(filename: str) -> str:
+    storage_dir = os.getenv("NEKEE_STORAGE_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "storage")
+    os.makedirs(storage_dir, exist_ok=True)
+    return os.path.join(storage_dir, filename)
+
+
 class KeyChecker(ABC):
+    API_BASE_URL = "" # Scheme and host every endpoint is built on, overridable with NEKEE_<NAME>_BASE_URL
+    LIVENESS_PATH = "" # GET endpoint that accepts or refuses a key without spending anything
+    PENDING_STATUS = "pending" # Status of a live key whose tier hasn't been looked up yet
+    MAX_LIVENESS_RETRIES = 5 # Inconclusive liveness checks (429, 5xx) a new key gets before it's dropped
+    KEY_PREFIXES: tuple[str, ...] = () # Literal prefixes keys start with, apart from the bare ones get_unprefixed_pattern finds
+    MAX_KEY_LENGTH = 512 # Upper bound on a match's length, used as the overlap between streamed chunks
+    CANDIDATE_KEYWORDS: tuple[str, ...] = () # Words near an ambiguous match that make it likely to be this checker's key
+    # (drop below, verify from) scores for ambiguous matches, overridable with NEKEE_<NAME>_CANDIDATE_THRESHOLDS;
+    # None verifies every match
+    CANDIDATE_THRESHOLDS: tuple[float, float] | None = None
+    JOURNALED_SETS = ("keys_with_special_features", "monthly_usage_reached_keys")
+    FAILURE_STATUSES = ("dead", "rate_limited")
+    HIGH_TIERS: tuple[str, ...] = () # Lower-cased tiers whose keys get re-verified less often once stable
+    HISTORY_LENGTH = 8
+    MIN_REVERIFY_FACTOR = 0.25 # Failing or flapping keys are re-verified this much sooner than the base interval
+    # Stable high-tier keys are never left longer than this times the base interval. They're handed out the most, so a
+    # revoked one has to be found within 18 hours by default; a consumer that sees one fail sooner can post it to
+    # /data/reverify.
+    MAX_REVERIFY_FACTOR = 1.5
+    FLAP_WINDOW = 3 * 24 * 60 * 60
+    STABLE_PERIOD = 7 * 24 * 60 * 60
+
     def __init__(self):
-        self.keys = {}
-        self.keys_with_special_features = set() # Keys that can do special features like reasoning summary
-        self.monthly_usage_reached_keys = set() # Keys that have reached their monthly usage limit
-        self.invalid_keys = []
+        self._store = KeyStore(self.JOURNALED_SETS)
+        # The live containers below are only for single-key lookups; anything that iterates uses snapshot().
+        self.keys = self._store.keys
+        self.api_base_url = os.getenv(f"NEKEE_{self.get_name().upper()}_BASE_URL", self.API_BASE_URL).rstrip("/")
+        self.keys_with_special_features = self._store.sets["keys_with_special_features"] # Keys that can do special features like reasoning summary
+        self.monthly_usage_reached_keys = self._store.sets["monthly_usage_reached_keys"] # Keys that have reached their monthly usage limit
+        self.key_records = self._store.records # Per-key last_verified, last_status_change, failures and status history
+        self.reverify_interval = float(os.getenv("NEKEE_REVERIFY_INTERVAL", str(60 * 60 * 12)))
+        self.enrich_interval = float(os.getenv("NEKEE_ENRICH_INTERVAL", str(3 * 24 * 60 * 60))) # How long a looked-up tier is trusted
+        self.invalid_keys = self._negative_cache() # Keys known to be invalid, checked before any network call
         self.compiled_regex = re.compile(self.get_regex_pattern())
+        thresholds = os.getenv(f"NEKEE_{self.get_name().upper()}_CANDIDATE_THRESHOLDS")
+        thresholds = tuple(float(value) for value in thresholds.split(",")) if thresholds else self.CANDIDATE_THRESHOLDS
+        self.candidate_filter = CandidateFilter(self.CANDIDATE_KEYWORDS, thresholds, get_denylist()) if thresholds else None
+        self._tier_index = self._store.tier_index
+        self._in_flight: dict[str, tuple[Future, int]] = {} # Verifications in progress, shared by concurrent callers
+        self._in_flight_lock = threading.Lock()
         self._load_keys()
 
     def _store_path(self) -> str:
-        base_dir = os.path.dirname(os.path.dirname(__file__))
-        storage_dir = os.path.join(base_dir, "storage")
-        os.makedirs(storage_dir, exist_ok=True)
-        return os.path.join(storage_dir, f"{self.get_name()}.json")
+        return storage_path(f"{self.get_name()}.json")
+
+    def _negative_cache(self) -> NegativeCache:
+        ttl = float(os.getenv("NEKEE_INVALID_CACHE_TTL", str(7 * 24 * 60 * 60)))
+        max_entries = int(os.getenv("NEKEE_INVALID_CACHE_SIZE", "100000"))
+        database = get_database()
+        if database is not None:
+            return SqliteNegativeCache(database, self.get_name(), ttl=ttl, max_entries=max_entries)
+        return NegativeCache(os.path.splitext(self._store_path())[0] + ".invalid", ttl=ttl, max_entries=max_entries)
 
     def _load_keys(self):
+        database = get_database()
+        if database is not None:
+            self._journal = SqliteJournal(
+                database,
+                self.get_name(),
+                self._store_path(),
+                self._apply_changes,
+                self._store.write,
+                compact_after=int(os.getenv("NEKEE_JOURNAL_COMPACT_RECORDS", "10000")),
+            )
+        else:
+            self._journal = KeyJournal(
+                self._store_path(),
+                fsync_interval=float(os.getenv("NEKEE_JOURNAL_FSYNC_INTERVAL", "1")),
+                compact_after=int(os.getenv("NEKEE_JOURNAL_COMPACT_RECORDS", "10000")),
+            )
         try:
-            with open(self._store_path(), "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    # Load keys dictionary
-                    if "keys" in data:
-                        self.keys.update({str(k): str(v) for k, v in data["keys"].items()})
-                    else:
-                        # Backward compatibility: if no "keys" field, treat whole data as keys
-                        self.keys.update({str(k): str(v) for k, v in data.items()})
-                    
-                    # Load other sets (keys_with_special_features, monthly_usage_reached_keys)
-                    if "keys_with_special_features" in data:
-                        self.keys_with_special_features = set(data["keys_with_special_features"])
-                    if "monthly_usage_reached_keys" in data:
-                        self.monthly_usage_reached_keys = set(data["monthly_usage_reached_keys"])
-                    for key, status in self.keys.items():
-                        if str(status).lower() == "rate_limited":
-                            self._schedule_retry(key)
-        except FileNotFoundError:
-            pass
+            data, records = self._journal.load()
+        except Exception:
+            data, records = None, []
+        with self._store.write():
+            self._store.touch()
+            self._restore(data, records)
+            for key, status in self.keys.items():
+                self._tier_index.set(key, status)
+        self._journal.start(self._snapshot)
+        get_lease("retries").on_acquired(self._schedule_rate_limited)
+        get_lease("enrichment").on_acquired(self._queue_pending_enrichment)
+
+    def _awaits_retry(self, key: str, status) -> bool:
+        # Rate-limited keys, and new keys whose liveness check hasn't had a conclusive answer yet.
+        return str(status).lower() == "rate_limited" or self._never_verified(key)
+
+    def _never_verified(self, key: str) -> bool:
+        return self.keys.get(key) == self.PENDING_STATUS and not self.last_verified_at(key)
+
+    def _schedule_rate_limited(self):
+        # Runs in whichever process holds the retries lease, at startup or when it takes the lease over.
+        for key, status in self.snapshot().keys.items():
+            if self._awaits_retry(key, status) and not get_retry_scheduler().is_scheduled(self, key):
+                self._schedule_retry(key)
+
+    def _restore(self, data, records: list[dict]):
+        try:
+            if isinstance(data, dict):
+                # Load keys dictionary
+                if "keys" in data:
+                    self.keys.update({str(k): str(v) for k, v in data["keys"].items()})
+                else:
+                    # Backward compatibility: if no "keys" field, treat whole data as keys
+                    self.keys.update({str(k): str(v) for k, v in data.items()})
+
+                # Load other sets (keys_with_special_features, monthly_usage_reached_keys)
+                if "keys_with_special_features" in data:
+                    self.keys_with_special_features.update(data["keys_with_special_features"])
+                if "monthly_usage_reached_keys" in data:
+                    self.monthly_usage_reached_keys.update(data["monthly_usage_reached_keys"])
+                if "key_records" in data:
+                    self.key_records.update({str(k): dict(v) for k, v in data["key_records"].items()})
+            for record in records:
+                self._apply_record(record)
         except Exception:
             pass
 
+    def _apply_record(self, record: dict):
+        op, key = record.get("op"), record.get("key")
+        if op == "set":
+            self._record_status(key, str(record.get("status")), float(record.get("at", 0)))
+            self.keys[key] = str(record.get("status"))
+        elif op == "delete":
+            self.keys.pop(key, None)
+            self.key_records.pop(key, None)
+        elif op == "verified":
+            self.key_records[key] = {**self.key_records.get(key, {}), "last_verified": float(record.get("at", 0))}
+        elif op == "enriched":
+            self.key_records[key] = {**self.key_records.get(key, {}), "last_enriched": float(record.get("at", 0))}
+        elif op == "add" and record.get("set") in self.JOURNALED_SETS:
+            getattr(self, record["set"]).add(key)
+        elif op == "discard" and record.get("set") in self.JOURNALED_SETS:
+            getattr(self, record["set"]).discard(key)
+
+    def _queue_pending_enrichment(self):
+        # Keys that were still waiting for their tier when the process holding this lease stopped. Those that never
+        # passed their liveness check are left to the retries.
+        for key, status in self.snapshot().keys.items():
+            if status == self.PENDING_STATUS and self.last_verified_at(key):
+                get_enrichment_queue().submit(self, key)
+
+    def _apply_changes(self, records: list[dict], data: dict | None = None):
+        # Changes other processes made to the shared store, or all of it when this process has to reload.
+        with self._store.write():
+            self._store.touch()
+            if data is not None:
+                touched = set(self.keys)
+                self.keys.clear()
+                self.key_records.clear()
+                for name in self.JOURNALED_SETS:
+                    getattr(self, name).clear()
+                self._restore(data, records)
+                touched.update(self.keys)
+            else:
+                for record in records:
+                    self._apply_record(record)
+                touched = {record.get("key") for record in records}
+            for key in touched:
+                if key in self.keys:
+                    self._tier_index.set(key, self.keys[key])
+                else:
+                    self._tier_index.remove(key)
+        if get_lease("retries").held():
+            for key in touched:
+                if key in self.keys and self._awaits_retry(key, self.keys[key]) and not get_retry_scheduler().is_scheduled(self, key):
+                    self._schedule_retry(key)
+
+    def snapshot(self) -> KeySnapshot:
+        return self._store.snapshot()
+
+    @property
+    def store_version(self) -> int:
+        return self._store.version
+
+    def _snapshot(self) -> dict:
+        # Compaction needs every write made before the journal was rotated, so this one can't be a stale snapshot.
+        snapshot = self._store.snapshot(current=True)
+        return {
+            "keys": dict(snapshot.keys),
+            "keys_with_special_features": list(snapshot.keys_with_special_features),
+            "monthly_usage_reached_keys": list(snapshot.monthly_usage_reached_keys),
+            "key_records": dict(snapshot.key_records),
+        }
+
     def _save_keys(self):
         try:
-            with open(self._store_path(), "w", encoding="utf-8") as f:
-                data = {
-                    "keys": self.keys,
-                    "keys_with_special_features": list(self.keys_with_special_features),
-                    "monthly_usage_reached_keys": list(self.monthly_usage_reached_keys)
-                }
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with metrics.save_keys_seconds.time(self.get_name()):
+                self._journal.flush()
         except Exception:
             pass
 
+    def _record_status(self, key: str, status: str, at: float):
+        # Callers hold the store's write lock.
+        record = dict(self.key_records.get(key, {}))
+        if str(status).lower() in self.FAILURE_STATUSES:
+            record["failures"] = record.get("failures", 0) + 1
+        else:
+            record.pop("failures", None)
+        # Waiting for a tier isn't a status of its own, so a new key's pending -> tier counts as one change, not two.
+        if self.keys.get(key) != status and status != self.PENDING_STATUS:
+            record["last_status_change"] = at
+            record["history"] = (record.get("history", []) + [[at, status]])[-self.HISTORY_LENGTH:]
+        self.key_records[key] = record
+
+    def _set_key_status(self, key: str, status: str):
+        # The journal record is appended under the same lock, so the journal replays writes in the order they happened.
+        with self._store.write():
+            now = time.time()
+            self._store.touch(self.keys.get(key) != status)
+            self._record_status(key, status, now)
+            self.keys[key] = status
+            self._tier_index.set(key, status)
+            self._journal.append({"op": "set", "key": key, "status": status, "at": now})
+        if status != "rate_limited":
+            get_retry_scheduler().reset(self, key)
+
+    def _delete_key(self, key: str):
+        with self._store.write():
+            self._store.touch(key in self.keys)
+            self.keys.pop(key, None)
+            self.key_records.pop(key, None)
+            self._tier_index.remove(key)
+            self._journal.append({"op": "delete", "key": key})
+        get_retry_scheduler().reset(self, key)
+
+    def _mark_verified(self, key: str):
+        with self._store.write():
+            if key not in self.keys and key not in self.monthly_usage_reached_keys:
+                return
+            now = time.time()
+            self.key_records[key] = {**self.key_records.get(key, {}), "last_verified": now}
+            self._journal.append({"op": "verified", "key": key, "at": now})
+        self._save_keys()
+
+    def _mark_enriched(self, key: str):
+        with self._store.write():
+            if key not in self.keys:
+                return
+            now = time.time()
+            self.key_records[key] = {**self.key_records.get(key, {}), "last_enriched": now}
+            self._journal.append({"op": "enriched", "key": key, "at": now})
+        self._save_keys()
+
+    def last_verified_at(self, key: str) -> float:
+        return self.key_records.get(key, {}).get("last_verified", 0.0)
+
+    def _is_high_tier(self, status: str) -> bool:
+        return str(status).lower() in self.HIGH_TIERS
+
+    def reverify_interval_for(self, key: str) -> float:
+        record = self.key_records.get(key, {})
+        status = self.keys.get(key, "")
+        now = time.time()
+        if record.get("failures") or str(status).lower() in self.FAILURE_STATUSES:
+            return self.reverify_interval * self.MIN_REVERIFY_FACTOR
+        if sum(1 for at, _ in record.get("history", []) if now - at < self.FLAP_WINDOW) >= 2:
+            return self.reverify_interval * max(self.MIN_REVERIFY_FACTOR, 0.5)
+        if self._is_high_tier(status):
+            stable_for = now - record.get("last_status_change", now)
+            return self.reverify_interval * min(self.MAX_REVERIFY_FACTOR, 1 + stable_for / self.STABLE_PERIOD)
+        return self.reverify_interval
+
+    def reverify_due_at(self, key: str) -> float:
+        return self.last_verified_at(key) + self.reverify_interval_for(key)
+
+    def _add_to_set(self, name: str, key: str):
+        with self._store.write():
+            self._store.touch(key not in getattr(self, name))
+            getattr(self, name).add(key)
+            self._journal.append({"op": "add", "set": name, "key": key})
+
+    def _discard_from_set(self, name: str, key: str):
+        with self._store.write():
+            if key in getattr(self, name):
+                self._store.touch()
+                getattr(self, name).discard(key)
+                self._journal.append({"op": "discard", "set": name, "key": key})
+
+    def _mark_special_feature(self, key: str):
+        self._add_to_set("keys_with_special_features", key)
+
+    def _unmark_special_feature(self, key: str):
+        self._discard_from_set("keys_with_special_features", key)
+
+    def _mark_monthly_usage_reached(self, key: str):
+        self._add_to_set("monthly_usage_reached_keys", key)
+        if self.keys.get(key) == self.PENDING_STATUS:
+            # Out of quota before its tier was known, so like before it's only kept for the monthly sweep.
+            self._delete_key(key)
+
     @abstractmethod
     def get_regex_pattern(self) -> str:
         pass
 
+    def get_unprefixed_pattern(self) -> str | None:
+        # Finds the start of keys that don't begin with one of KEY_PREFIXES.
+        return None if self.KEY_PREFIXES else self.get_regex_pattern()
+
     @abstractmethod
-    def verify_key(self, key: str, reverify: bool = False):
+    def _auth_headers(self, key: str) -> dict[str, str]:
         pass
 
+    def _authenticated_despite(self, status: int, error_message: str) -> bool:
+        # Whether a refused liveness check (lowercased message) still shows the key authenticated, e.g. a key that
+        # lacks the permission the liveness endpoint needs but not the ones enrichment does.
+        return False
+
+    def _liveness_request(self, key) -> urllib.request.Request:
+        return urllib.request.Request(self.api_base_url + self.LIVENESS_PATH, headers=self._auth_headers(key), method="GET")
+
+    def verify_key(self, key, reverify: bool = False):
+        # Verification only asks whether the key is accepted, which costs nothing; the tier and features come from
+        # enrich_key, queued behind the verifications.
+        alive = self.check_liveness(key, reverify)
+        if alive and self._needs_enrichment(self._flight_key(key)):
+            get_enrichment_queue().submit(self, self._flight_key(key))
+        return alive
+
+    def check_liveness(self, key, reverify: bool = False):
+        state_key = self._flight_key(key)
+        if state_key in self.invalid_keys:
+            return
+        try:
+            with self._urlopen(self._liveness_request(key), timeout=10) as resp:
+                body = resp.read()
+                if resp.status >= 400:
+                    raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, body)
+        except urllib.error.HTTPError as err:
+            if err.code == 429 or err.code >= 500:
+                # Says nothing about the key itself; ask again later without stamping it as verified. A new key is
+                # stored as pending (never served) so whichever process holds the retries lease, now or after a
+                # restart, asks again; it isn't worth asking about forever, though.
+                if state_key not in self.keys:
+                    self._set_key_status(state_key, self.PENDING_STATUS)
+                    self._save_keys()
+                elif self._never_verified(state_key) and get_retry_scheduler().attempts(self, state_key) >= self.MAX_LIVENESS_RETRIES:
+                    print("Giving up on key", state_key, "after", self.MAX_LIVENESS_RETRIES, "inconclusive liveness checks")
+                    self._delete_key(state_key)
+                    self._save_keys()
+                    return
+                print("Liveness check for key", state_key, "failed with", err.code, "- retrying in 10 minutes")
+                self._schedule_retry(state_key)
+                return
+            if not self._authenticated_despite(err.code, self._extract_error_message(err).lower()):
+                get_retry_scheduler().reset(self, state_key)
+                self._mark_failed(state_key, reverify)
+                self._mark_verified(state_key)
+                return
+            print("Key", state_key, "is authenticated but can't use the liveness endpoint")
+        if self.keys.get(state_key) != "rate_limited":
+            # A rate-limited key keeps backing off until enrichment gets through.
+            get_retry_scheduler().reset(self, state_key)
+        if state_key not in self.keys:
+            self._set_key_status(state_key, self.PENDING_STATUS)
+            print("Key", state_key, "is live, tier pending")
+            self._save_keys()
+        self._mark_verified(state_key)
+        return True
+
+    def _mark_failed(self, key: str, reverify: bool = False):
+        if self._never_verified(key):
+            # Stored only while its liveness check was being retried.
+            self._delete_key(key)
+            self._save_keys()
+        if key not in self.keys:
+            print("Not a valid key", key)
+            self.invalid_keys.add(key)
+            return
+        if self.keys[key] == "dead" and not reverify:
+            self._delete_key(key)
+            self._unmark_special_feature(key)
+            print("Deleted key", key, "because it is dead")
+        else:
+            self._set_key_status(key, "dead")
+            print("Marked key", key, "as dead")
+        self._save_keys()
+
+    def _needs_enrichment(self, key: str) -> bool:
+        status = str(self.keys.get(key, "")).lower()
+        # A dead key that is accepted again keeps its status until enrichment finds it working, or deletes it.
+        if status in (self.PENDING_STATUS, "rate_limited", "dead") or key in self.monthly_usage_reached_keys:
+            return True
+        return time.time() - self.key_records.get(key, {}).get("last_enriched", 0.0) >= self.enrich_interval
+
+    def was_enriched(self, key: str) -> bool:
+        return "last_enriched" in self.key_records.get(key, {})
+
+    @abstractmethod
+    def enrich_key(self, key) -> bool | None:
+        # Looks up the tier and features of a live key and stores them; True once they're known.
+        pass
+
+    def enrich(self, key):
+        state_key = self._flight_key(key)
+        if state_key not in self.keys and state_key not in self.monthly_usage_reached_keys:
+            return None # Deleted since it was queued
+        started = time.perf_counter()
+        try:
+            result = self.enrich_key(key)
+        except BaseException:
+            metrics.enrichment_seconds.observe(time.perf_counter() - started, self.get_name(), "error")
+            raise
+        metrics.enrichment_seconds.observe(
+            time.perf_counter() - started, self.get_name(), self._verification_outcome(state_key, result)
+        )
+        if result:
+            self._mark_enriched(state_key)
+        return result
+
     def get_name(self) -> str:
         return self.__class__.__name__.replace("KeyChecker", "").lower()
 
     def extract_keys(self, text: str) -> list[str]:
         return self.compiled_regex.findall(text)
 
-    def check_text(self, text: str, reverify: bool = False):
-        for key in self.extract_keys(text):
+    def _is_ambiguous(self, key) -> bool:
+        # Whether a match could just as well be something other than a key, and is scored before it's verified.
+        return True
+
+    def candidate_lane(self, text: str, start: int, end: int, key) -> str:
+        # Where a match found at text[start:end] goes: VERIFY, LOW_PRIORITY or DROP. Keys already stored always verify.
+        if self.candidate_filter is None or not self._is_ambiguous(key) or key in self.keys:
+            return VERIFY
+        return self.candidate_filter.lane(text, start, end, key)
+
+    def _keys_to_verify(self, matches, reverify: bool = False):
+        for key in matches:
+            if key in self.invalid_keys:
+                continue
             if reverify or (key not in self.keys):
-                self.verify_key(key, reverify)
-        self.invalid_keys = []
-
-    def list_keys(self, tier=None) -> list[str]:
-        return [
-            k for k, v in self.keys.items()
-            if (
-                str(v).lower() != "dead"
-                if tier is None
-                else str(v).lower() == str(tier).lower()
-            )
-        ]
-    
-    def list_keys_by_tiers(self) -> dict[str, list[str]]:
-        tiers: dict[str, list[str]] = {}
-        for key, tier in self.keys.items():
-            if tier != "dead": tiers.setdefault(tier, []).append(key)
-        return tiers
+                yield key
+
+    def _flight_key(self, key) -> str:
+        return key
+
+    def verify(self, key, reverify: bool = False):
+        return self._single_flight(key, lambda: self.verify_key(key, reverify))
+
+    def _single_flight(self, key, check: Callable[[], object]):
+        # Runs `check` for `key` unless a check of the same key is already running, in which case its result is shared.
+        flight_key = self._flight_key(key)
+        with self._in_flight_lock:
+            flight = self._in_flight.get(flight_key)
+            if flight is None:
+                future = Future()
+                self._in_flight[flight_key] = (future, threading.get_ident())
+        if flight is not None:
+            future, owner = flight
+            # A verification that reaches its own key again (e.g. through child key discovery) must not wait on itself.
+            if owner == threading.get_ident():
+                return None
+            return future.result()
+        started = time.perf_counter()
+        try:
+            result = check()
+        except BaseException as err:
+            metrics.verification_seconds.observe(time.perf_counter() - started, self.get_name(), "error")
+            with self._in_flight_lock:
+                self._in_flight.pop(flight_key, None)
+            future.set_exception(err)
+            raise
+        metrics.verification_seconds.observe(
+            time.perf_counter() - started, self.get_name(), self._verification_outcome(flight_key, result)
+        )
+        with self._in_flight_lock:
+            self._in_flight.pop(flight_key, None)
+        future.set_result(result)
+        return result
+
+    def _verification_outcome(self, key: str, result) -> str:
+        # verify_key only reports success, so every other outcome is read back from the state it left behind.
+        if result:
+            return "verified"
+        if key in self.invalid_keys:
+            return "invalid"
+        if key in self.monthly_usage_reached_keys:
+            return "quota"
+        if str(self.keys.get(key, "")).lower() == "rate_limited":
+            return "rate_limited"
+        return "dead"
+
+
+    def list_keys(self, tier=None) -> tuple[str, ...]:
+        return self.snapshot().list_keys(tier)
+
+    def list_keys_by_tiers(self) -> dict[str, tuple[str, ...]]:
+        return self.snapshot().by_tier()
+
+    def count_keys(self, tier=None) -> int:
+        return self._tier_index.count(tier)
+
+    def count_keys_by_tiers(self) -> dict[str, int]:
+        return self._tier_index.counts()
+
+    def verifications_in_flight(self) -> int:
+        return len(self._in_flight)
 
     def get_key(self, tier=None):
-        keys = self.list_keys(tier)
-        if not keys:
+        key = self._tier_index.random_key(tier)
+        if key is None:
             raise HTTPException(status_code=404, detail="no keys available for tier")
-        return random.choice(keys)
-    
+        return key
+
     def _schedule_retry(self, key: str, delay_seconds: int = 600) -> None:
-        timer = threading.Timer(delay_seconds, self.verify_key, args=(key,))
-        timer.daemon = True
-        timer.start()
+        # Other processes leave their rate-limited keys to the lease holder, which sees them in the shared store.
+        if get_lease("retries").held():
+            get_retry_scheduler().schedule(self, key, delay_seconds)
+
+    def _urlopen(self, request: urllib.request.Request, timeout: float = 10):
+        try:
+            response = http_client.urlopen(request, timeout=timeout, key_limited=self._key_limited)
+        except urllib.error.HTTPError as err:
+            metrics.upstream_requests.inc(self.get_name(), str(err.code))
+            raise
+        except Exception:
+            metrics.upstream_requests.inc(self.get_name(), "error")
+            raise
+        metrics.upstream_requests.inc(self.get_name(), str(response.status))
+        return response
+
+    def _quota_exhausted(self, error_message: str) -> bool:
+        # Whether a lowercased 429/400 error message says the key itself is out of quota, as opposed to being rate
+        # limited.
+        return "quota" in error_message or "exhausted" in error_message or "credit" in error_message
+
+    def _key_limited(self, status: int, body: bytes) -> bool:
+        return status == 429 and self._quota_exhausted(body.decode("utf-8", errors="ignore").lower())
 
     def _extract_error_message(self, error: urllib.error.HTTPError) -> str:
         try:
@@ -115,5 +631,3 @@ class KeyChecker(ABC):
             return error.reason or ""
         decoded_body = raw_body.decode("utf-8", errors="ignore") if raw_body else ""
         return decoded_body or (error.reason or "")
-
-
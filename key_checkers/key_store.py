@@ -0,0 +1,150 @@
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Iterable
+
+try:
+    from .tier_index import UNSERVED_TIERS, TierIndex
+except ImportError:
+    import os
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.tier_index import UNSERVED_TIERS, TierIndex
+
+
+# An immutable view of a KeyStore at one version. Readers can hold on to it for as long as they like.
+class KeySnapshot:
+    def __init__(self, version: int, sequence: int, keys: dict, sets: dict[str, frozenset], records: dict):
+        self.version = version
+        self.sequence = sequence
+        self.keys = MappingProxyType(keys)
+        self.sets = MappingProxyType(sets)
+        self.key_records = MappingProxyType(records)
+        self._groups: dict[str, tuple[str, tuple[str, ...]]] | None = None
+        self._sorted: dict[str | None, tuple[str, ...]] = {}
+
+    @property
+    def keys_with_special_features(self) -> frozenset:
+        return self.sets.get("keys_with_special_features", frozenset())
+
+    @property
+    def monthly_usage_reached_keys(self) -> frozenset:
+        return self.sets.get("monthly_usage_reached_keys", frozenset())
+
+    def _tiers(self) -> dict[str, tuple[str, tuple[str, ...]]]:
+        # Lower-cased tier -> (tier as it was first seen, its keys). Built once per snapshot; two threads racing here
+        # just build the same thing twice.
+        if self._groups is None:
+            groups: dict[str, list[str]] = {}
+            labels: dict[str, str] = {}
+            for key, status in self.keys.items():
+                normalized = str(status).lower()
+                labels.setdefault(normalized, str(status))
+                groups.setdefault(normalized, []).append(key)
+            self._groups = {normalized: (labels[normalized], tuple(keys)) for normalized, keys in groups.items()}
+        return self._groups
+
+    def by_tier(self) -> dict[str, tuple[str, ...]]:
+        return {label: keys for normalized, (label, keys) in self._tiers().items() if normalized not in UNSERVED_TIERS}
+
+    def list_keys(self, tier=None) -> tuple[str, ...]:
+        if tier is None:
+            return tuple(key for keys in self.by_tier().values() for key in keys)
+        return self._tiers().get(str(tier).lower(), ("", ()))[1]
+
+    def sorted_keys(self, tier=None) -> tuple[str, ...]:
+        # Sorted so a page cursor (the last key a client saw) still means the same place after keys come and go.
+        normalized = None if tier is None else str(tier).lower()
+        keys = self._sorted.get(normalized)
+        if keys is None:
+            keys = self._sorted[normalized] = tuple(sorted(self.list_keys(tier)))
+        return keys
+
+    def tier_of(self, key: str) -> str:
+        status = str(self.keys.get(key, ""))
+        return self._tiers().get(status.lower(), (status, ()))[0]
+
+    def count(self, tier=None) -> int:
+        if tier is None:
+            return sum(len(keys) for normalized, (_, keys) in self._tiers().items() if normalized not in UNSERVED_TIERS)
+        return len(self.list_keys(tier))
+
+
+# Owns a checker's keys, sets, per-key records and tier index. Writers change them inside write(), one at a time, and
+# call touch() for what they actually changed; readers take snapshot() and never touch the live containers while
+# iterating.
+#
+# `version` only moves when keys or sets change, so the responses cached on it survive writes that only stamp a
+# record. `_sequence` is odd while a write is in progress and moves on every write; snapshot() copies the containers
+# without the lock and keeps the copy only if the sequence was even and the same before and after.
+class KeyStore:
+    COPY_ATTEMPTS = 3 # Lock-free copies tried before snapshot() takes the lock
+
+    def __init__(self, set_names: Iterable[str]):
+        self.keys: dict[str, str] = {}
+        self.sets: dict[str, set] = {name: set() for name in set_names}
+        # Records are replaced rather than changed in place, so a snapshot can share them with the live store.
+        self.records: dict[str, dict] = {}
+        self.tier_index = TierIndex()
+        self.version = 0
+        self._sequence = 0
+        self._depth = 0
+        self._touched = False
+        self._lock = threading.RLock()
+        self._snapshot: KeySnapshot | None = None
+
+    @contextmanager
+    def write(self):
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                self._sequence += 1
+                self._touched = False
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._touched:
+                        self.version += 1
+                    self._sequence += 1
+
+    def touch(self, content: bool = True):
+        # Called inside write() by writers that changed keys or sets; records alone don't change what's served.
+        if content:
+            self._touched = True
+
+    def _copy(self) -> KeySnapshot:
+        # Plain dict and set copies run without releasing the GIL, so each one is a consistent copy on its own.
+        return KeySnapshot(
+            self.version,
+            self._sequence,
+            dict(self.keys),
+            {name: frozenset(keys) for name, keys in self.sets.items()},
+            dict(self.records),
+        )
+
+    def snapshot(self, current: bool = False) -> KeySnapshot:
+        # A snapshot may lag behind record-only writes unless `current` asks for every write made so far.
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.version and (not current or snapshot.sequence == self._sequence):
+            return snapshot
+        for _ in range(self.COPY_ATTEMPTS):
+            sequence = self._sequence
+            if sequence % 2:
+                # A write is in progress; readers that don't need it make do with the last snapshot.
+                if snapshot is not None and not current:
+                    return snapshot
+                continue
+            copy = self._copy()
+            if self._sequence == sequence:
+                return self._publish(copy)
+        with self._lock:
+            return self._publish(self._copy())
+
+    def _publish(self, snapshot: KeySnapshot) -> KeySnapshot:
+        current = self._snapshot
+        if current is None or current.sequence < snapshot.sequence:
+            self._snapshot = snapshot
+        return snapshot
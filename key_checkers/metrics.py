@@ -0,0 +1,178 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+# Seconds, from a cached hit up to a slow multi-region probe.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+# Updates only touch a dict under an uncontended lock; all formatting happens when /metrics is scraped.
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (non-cumulative, last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(label_values, list(counts), total) for label_values, (counts, total) in self._values.items()]
+        for label_values, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}"
+
+
+# Computed from live state at scrape time, so nothing has to keep it up to date.
+class GaugeCallback:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...], read: Callable[[], Iterable[tuple[tuple, float]]]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.read = read
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} gauge"
+        for label_values, value in self.read():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as err:
+                print("Error collecting metric", metric.name, err)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+verification_seconds = REGISTRY.register(Histogram(
+    "nekee_verification_seconds",
+    "Time spent verifying a key, by outcome.",
+    ("checker", "outcome"),
+))
+upstream_requests = REGISTRY.register(Counter(
+    "nekee_upstream_requests_total",
+    "Requests made to provider APIs, by HTTP status (\"error\" when no response came back).",
+    ("checker", "status"),
+))
+extract_keys_seconds = REGISTRY.register(Histogram(
+    "nekee_extract_keys_seconds",
+    "Time spent extracting candidate keys from text, per checker.",
+    ("checker",),
+))
+save_keys_seconds = REGISTRY.register(Histogram(
+    "nekee_save_keys_seconds",
+    "Time spent handing journal records to the OS.",
+    ("checker",),
+    buckets=(0.00001, 0.0001, 0.001, 0.01, 0.1, 1),
+))
+scan_seconds = REGISTRY.register(Histogram(
+    "nekee_scan_seconds",
+    "Time spent scanning one /data body for every checker's keys.",
+))
+scanned_bytes = REGISTRY.register(Counter(
+    "nekee_scanned_bytes_total",
+    "Bytes of /data bodies scanned for keys.",
+))
+ingest_rejected = REGISTRY.register(Counter(
+    "nekee_ingest_rejected_total",
+    "/data requests turned away with a 503 because the ingest queue was full or every scan slot was taken.",
+))
+enrichment_seconds = REGISTRY.register(Histogram(
+    "nekee_enrichment_seconds",
+    "Time spent looking up the tier and features of a live key, by outcome.",
+    ("checker", "outcome"),
+))
+candidates = REGISTRY.register(Counter(
+    "nekee_candidates_total",
+    "Distinct matches found in /data bodies, by the lane their candidate score put them in.",
+    ("checker", "lane"),
+))
+low_priority_rejected = REGISTRY.register(Counter(
+    "nekee_low_priority_rejected_total",
+    "Low-confidence candidates dropped because the low-priority lane was full.",
+    ("checker",),
+))
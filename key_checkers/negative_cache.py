@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+# Keys known to be invalid, stored as 16-byte digests with an expiry. The file is an append-only log of
+# "<digest> <expires_at>" lines that is rewritten once it holds twice as many lines as live entries. Only one
+# process may use the file; worker processes sharing NEKEE_DATABASE use SqliteNegativeCache instead.
+class NegativeCache:
+    def __init__(self, path: str, ttl: float = 7 * 24 * 60 * 60, max_entries: int = 100_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[bytes, float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._lines = 0
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _digest(self, key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _load(self):
+        now = time.time()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        digest, expires_at = line.split()
+                        digest, expires_at = bytes.fromhex(digest), float(expires_at)
+                    except ValueError:
+                        continue
+                    if expires_at > now:
+                        self._remember(digest, expires_at)
+        except FileNotFoundError:
+            pass
+        if self._lines > len(self._entries):
+            self._rewrite()
+
+    def _rewrite(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for digest, expires_at in self._entries.items():
+                f.write(f"{digest.hex()} {expires_at:.0f}\n")
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._entries)
+
+    def _refresh(self):
+        # Picks up entries other processes added; called on a miss, with the lock held.
+        pass
+
+    def _persist(self, digest: bytes, expires_at: float):
+        # Called with the lock held.
+        self._file.write(f"{digest.hex()} {expires_at:.0f}\n")
+        self._file.flush()
+        self._lines += 1
+        if self._lines > 2 * max(len(self._entries), 1_000):
+            self._file.close()
+            self._rewrite()
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def _remember(self, digest: bytes, expires_at: float):
+        self._entries[digest] = expires_at
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key: str) -> bool:
+        digest = self._digest(key)
+        with self._lock:
+            expires_at = self._entries.get(digest)
+            if expires_at is None:
+                self._refresh()
+                expires_at = self._entries.get(digest)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return False
+            return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str):
+        digest = self._digest(key)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(digest, expires_at)
+            try:
+                self._persist(digest, expires_at)
+            except Exception as err:
+                print("Error persisting", self.path, err)
@@ -10,6 +10,10 @@ import urllib.error
 import json
 
 class OpenAIKeyChecker(KeyChecker):
+    API_BASE_URL = "https://api.openai.com"
+    LIVENESS_PATH = "/v1/models"
+    KEY_PREFIXES = ("sk-",)
+    HIGH_TIERS = ("tier_3", "tier_4", "tier_5")
     TIER_BY_LIMITS = { # For gpt-5-nano
         (500, 200_000): "Tier_1",
         (5_000, 2_000_000): "Tier_2",
@@ -25,40 +29,40 @@ class OpenAIKeyChecker(KeyChecker):
         tpm = int((headers.get("x-ratelimit-limit-tokens") or "0").replace(",", ""))
         return self.TIER_BY_LIMITS.get((rpm, tpm), "unknown")
 
-    def verify_key(self, key: str, reverify: bool = False):
-        if key in self.invalid_keys:
-            return
+    def _auth_headers(self, key: str) -> dict[str, str]:
+        return {"Authorization": f"Bearer {key}"}
+
+    def _authenticated_despite(self, status: int, error_message: str) -> bool:
+        # Restricted keys without the Models read scope are refused by /v1/models but can still generate.
+        return status == 403 and ("insufficient permissions" in error_message or "missing scope" in error_message)
+
+    def enrich_key(self, key: str):
+        # The tier only shows in the rate limit headers of a generation, so this is the billed part of a check.
         req = urllib.request.Request(
-            "https://api.openai.com/v1/responses",
+            f"{self.api_base_url}/v1/responses",
             data=json.dumps({"model": "gpt-5-nano", "input": "Just say \"a\"", "reasoning": {"effort": "low"}}).encode("utf-8"),
-            headers={
-                "Authorization": f"Bearer {key}",
-                "Content-Type": "application/json",
-            },
+            headers={**self._auth_headers(key), "Content-Type": "application/json"},
             method="POST",
         )
         req_reasoning_summary = urllib.request.Request(
-            "https://api.openai.com/v1/responses",
+            f"{self.api_base_url}/v1/responses",
             data=json.dumps({"model": "gpt-5-nano", "input": "Just say \"a\"", "reasoning": {"effort": "low", "summary": "auto"}}).encode("utf-8"),
-            headers={
-                "Authorization": f"Bearer {key}",
-                "Content-Type": "application/json",
-            },
+            headers={**self._auth_headers(key), "Content-Type": "application/json"},
             method="POST",
         )
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with self._urlopen(req, timeout=10) as resp:
                 if resp.status >= 400:
                     raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, resp.read())
-                self.keys[key] = self._tier_from_headers(resp.headers)
+                self._set_key_status(key, self._tier_from_headers(resp.headers))
                 print("Verified key", key, "with tier", self.keys[key])
-                if not reverify:
+                if not self.was_enriched(key): # A key's features are only looked up once
                     try:
-                        with urllib.request.urlopen(req_reasoning_summary, timeout=10) as resp:
+                        with self._urlopen(req_reasoning_summary, timeout=10) as resp:
                             if resp.status >= 400:
                                 raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, resp.read())
                             print("Key", key, "with tier", self.keys[key], "can do reasoning summary")
-                            self.keys_with_special_features.add(key)
+                            self._mark_special_feature(key)
                     except urllib.error.HTTPError:
                         pass
                 self._save_keys()
@@ -67,27 +71,16 @@ class OpenAIKeyChecker(KeyChecker):
             if err.code == 429 or err.code == 400:
                 error_message = self._extract_error_message(err).lower()
                 print("Error message:", error_message)
-                if "quota" in error_message or "exhausted" in error_message or "credit" in error_message:
+                if self._quota_exhausted(error_message):
                     print("Monthly usage reached for key", key)
-                    self.monthly_usage_reached_keys.add(key)
+                    self._mark_monthly_usage_reached(key)
+                    return
                 elif "rate" in error_message or "large" in error_message:
                     print("Rate limit reached for key", key, "- retrying in 10 minutes")
-                    self.keys[key] = "rate_limited"
+                    self._set_key_status(key, "rate_limited")
                     self._schedule_retry(key)
                     self._save_keys()
                     return
 
-            if key not in self.keys:
-                print("Not a valid key", key)
-                self.invalid_keys.append(key)
-                return
-            if self.keys[key] == "dead" and not reverify:
-                del self.keys[key]
-                if key in self.keys_with_special_features:
-                    self.keys_with_special_features.remove(key)
-                print("Deleted key", key, "because it is dead")
-            else:
-                self.keys[key] = "dead"
-                print("Marked key", key, "as dead")
-            self._save_keys()
+            self._mark_failed(key)
 
@@ -8,18 +8,96 @@ except ImportError:
     from key_checkers.key_checker import KeyChecker
 
 import json
+import os
+import threading
 import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+# One breadth-first walk over the keys a provisioning key manages and the keys those manage in turn, each checked once.
+# Every step runs on the checker's discovery pool and hands the next level back to it instead of waiting, so a walk
+# never holds a worker (or the enrichment worker that started it) while its children run.
+class _ChildKeyWalk:
+    def __init__(self, checker: "OpenRouterKeyChecker", root: str, credits: Callable[[], float]):
+        self.checker = checker
+        self.root = root
+        self.credits = credits
+        self.seen = {root}
+        self._outstanding = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self.checker._walks_lock:
+            self.checker._walks += 1
+        self._submit(self._expand, self.root)
+
+    def _submit(self, step: Callable[[str], None], key: str):
+        with self._lock:
+            self._outstanding += 1
+        self.checker._discovery_executor.submit(self._run, step, key)
+
+    def _run(self, step: Callable[[str], None], key: str):
+        try:
+            step(key)
+        except Exception as err:
+            print("Error checking child key of", self.root, err)
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                finished = not self._outstanding
+            if finished:
+                with self.checker._walks_lock:
+                    self.checker._walks -= 1
+                if len(self.seen) > 1:
+                    print("Checked", len(self.seen) - 1, "child keys of", self.root)
+
+    def _expand(self, key: str):
+        for hashed_key in self.checker._list_child_keys(key):
+            if hashed_key in self.checker.keys or hashed_key in self.checker.invalid_keys:
+                continue
+            with self._lock:
+                if hashed_key in self.seen:
+                    continue
+                self.seen.add(hashed_key)
+            self._submit(self._check, hashed_key)
+
+    def _check(self, key: str):
+        if self.checker._check_child_key(key, self.credits):
+            self._expand(key)
 
 
 class OpenRouterKeyChecker(KeyChecker):
-    KEY_ENDPOINT = "https://openrouter.ai/api/v1/key"
-    KEYS_ENDPOINT = "https://openrouter.ai/api/v1/keys"
-    CREDITS_ENDPOINT = "https://openrouter.ai/api/v1/credits"
+    KEY_PREFIXES = ("sk-or-v1-",)
+    HIGH_TIERS = ("paid",)
+    API_BASE_URL = "https://openrouter.ai"
+    KEY_PATH = "/api/v1/key"
+    KEYS_PATH = "/api/v1/keys"
+    CREDITS_PATH = "/api/v1/credits"
+    LIVENESS_PATH = KEY_PATH
+
+    def __init__(self):
+        super().__init__()
+        # Child keys of every provisioning key being walked share this pool, so one big account can't take over.
+        self._discovery_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("NEKEE_OPENROUTER_DISCOVERY_CONCURRENCY", "4")),
+            thread_name_prefix="openrouter-discovery",
+        )
+        self._walks = 0
+        self._walks_lock = threading.Lock()
 
     def get_regex_pattern(self) -> str:
         return r"sk-or-v1-[a-z0-9]{64}"
 
+    def discoveries_running(self) -> int:
+        # Child key walks that haven't finished yet.
+        return self._walks
+
+    def _quota_exhausted(self, error_message: str) -> bool:
+        # "exhausted" is how a rate limit is worded here.
+        return "quota" in error_message
+
     def _decode_json(self, payload: bytes) -> dict:
         if not payload:
             return {}
@@ -28,20 +106,33 @@ class OpenRouterKeyChecker(KeyChecker):
         except Exception:
             return {}
 
-    def _tier_from_payload(self, payload: dict, key: str) -> str:
+    def _tier_from_payload(self, payload: dict, credits: Callable[[], float]) -> str:
         data = payload.get("data", payload) if isinstance(payload, dict) else payload
         if isinstance(data, dict) and data.get("is_free_tier"):
             return "Free"
-        return "Free" if self._remaining_credits(key) <= 0 else "Paid"
+        return "Free" if credits() <= 0 else "Paid"
+
+    def _account_credits(self, key: str) -> Callable[[], float]:
+        # Credits belong to the account, so every key found under `key` shares one lookup, made when first needed.
+        lock = threading.Lock()
+        remaining: list[float] = []
+
+        def credits() -> float:
+            with lock:
+                if not remaining:
+                    remaining.append(self._remaining_credits(key))
+                return remaining[0]
+
+        return credits
 
     def _remaining_credits(self, key: str) -> float:
         req = urllib.request.Request(
-            self.CREDITS_ENDPOINT,
-            headers={"Authorization": f"Bearer {key}"},
+            self.api_base_url + self.CREDITS_PATH,
+            headers=self._auth_headers(key),
             method="GET",
         )
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with self._urlopen(req, timeout=10) as resp:
                 body = resp.read()
                 if resp.status >= 400:
                     raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, body)
@@ -58,76 +149,74 @@ class OpenRouterKeyChecker(KeyChecker):
             return float("inf")
         return total_credits - total_usage
 
-    def _discover_child_keys(self, key: str):
+    def _list_child_keys(self, key: str) -> list[str]:
         req = urllib.request.Request(
-            self.KEYS_ENDPOINT,
-            headers={"Authorization": f"Bearer {key}"},
+            self.api_base_url + self.KEYS_PATH,
+            headers=self._auth_headers(key),
             method="GET",
         )
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with self._urlopen(req, timeout=10) as resp:
                 body = resp.read()
                 if resp.status >= 400:
                     raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, body)
         except urllib.error.HTTPError:
-            return
+            return []
         payload = self._decode_json(body)
         data = payload.get("data") if isinstance(payload, dict) else None
         if not isinstance(data, list):
-            return
-        for entry in data:
-            if not isinstance(entry, dict) or entry.get("disabled"):
-                continue
-            hashed_key = entry.get("hash")
-            if (
-                not isinstance(hashed_key, str)
-                or hashed_key == key
-                or hashed_key in self.keys
-                or hashed_key in self.invalid_keys
-            ):
-                continue
-            self.verify_key(hashed_key)
+            return []
+        return [
+            entry["hash"]
+            for entry in data
+            if isinstance(entry, dict) and not entry.get("disabled") and isinstance(entry.get("hash"), str)
+        ]
 
-    def verify_key(self, key: str, reverify: bool = False):
-        if key in self.invalid_keys:
-            return
-        retry = False
+    def _check_child_key(self, key: str, credits: Callable[[], float]):
+        # One request both verifies a child key and finds its tier, so it skips the liveness check and the enrichment
+        # queue, but not the single-flight every verification of a key goes through.
+        result = self._single_flight(key, lambda: self._check_key(key, credits))
+        if result:
+            self._mark_verified(key)
+            self._mark_enriched(key)
+        return result
+
+    def _auth_headers(self, key: str) -> dict[str, str]:
+        return {"Authorization": f"Bearer {key}"}
+
+    def enrich_key(self, key: str):
+        credits = self._account_credits(key)
+        result = self._check_key(key, credits)
+        if result:
+            # The walk goes on in the background; this enrichment worker moves on to the next key.
+            _ChildKeyWalk(self, key, credits).start()
+        return result
+
+    def _check_key(self, key: str, credits: Callable[[], float]):
         req = urllib.request.Request(
-            self.KEY_ENDPOINT,
-            headers={"Authorization": f"Bearer {key}"},
+            self.api_base_url + self.KEY_PATH,
+            headers=self._auth_headers(key),
             method="GET",
         )
         try:
-            with urllib.request.urlopen(req, timeout=10) as resp:
+            with self._urlopen(req, timeout=10) as resp:
                 body = resp.read()
                 if resp.status >= 400:
                     raise urllib.error.HTTPError(resp.url, resp.status, resp.reason, resp.headers, body)
-                tier = self._tier_from_payload(self._decode_json(body), key)
-                self.keys[key] = tier
+                tier = self._tier_from_payload(self._decode_json(body), credits)
+                self._set_key_status(key, tier)
                 print("Verified key", key, "with tier", tier)
                 self._save_keys()
-                self._discover_child_keys(key)
                 return True
         except urllib.error.HTTPError as err:
-            retry = False
             if err.code == 429:
                 error_message = self._extract_error_message(err).lower()
+                if self._quota_exhausted(error_message):
+                    print("Monthly usage reached for key", key)
+                    self._mark_monthly_usage_reached(key)
+                    return
                 if "rate" in error_message or "large" in error_message or "exhausted" in error_message:
                     print("Rate limit reached for key", key, "- retrying in 10 minutes")
-                    retry = True
                     self._schedule_retry(key)
-                if "quota" in error_message:
-                    print("Monthly usage reached for key", key)
-                    self.monthly_usage_reached_keys.add(key)
-
-            if key not in self.keys and not retry:
-                print("Not a valid key", key)
-                self.invalid_keys.append(key)
-                return
-            if self.keys[key] == "dead" and not reverify:
-                del self.keys[key]
-                print("Deleted key", key, "because it is dead")
-            else:
-                self.keys[key] = "dead"
-                print("Marked key", key, "as dead")
-            self._save_keys()
\ No newline at end of file
+                    return
+            self._mark_failed(key)
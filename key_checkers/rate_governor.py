@@ -0,0 +1,61 @@
+import email.utils
+import threading
+import time
+
+
+def _parse_retry_after(value) -> float:
+    if not value:
+        return 0.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Token bucket for one provider host. A 429 halves the refill rate and honours retry-after (up to max_pause);
+# every other non-5xx response adds back a twentieth of the configured rate until it is reached again. 429s that are
+# about one key's quota are never reported here (see ConnectionPool.urlopen).
+class RateGovernor:
+    def __init__(self, rate: float, burst: float, min_rate: float = 0.2, max_pause: float = 60.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.max_pause = max_pause
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_response(self, status: int, headers=None):
+        with self._lock:
+            if status == 429:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, 0)
+                retry_after = min(_parse_retry_after(headers.get("retry-after") if headers else None), self.max_pause)
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            elif status < 500 and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .shared_store import get_lease
+except ImportError:
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.shared_store import get_lease
+
+
+# One dispatcher thread for every rate-limited key instead of a threading.Timer each. Due times live in a
+# min-heap; rescheduling a key leaves its old entry in the heap, which is skipped when it surfaces.
+class RetryScheduler:
+    def __init__(self, max_concurrent: int = 4, max_delay: float = 6 * 60 * 60, jitter: float = 0.2):
+        self.max_concurrent = max_concurrent
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._heap: list = []
+        self._due: dict[tuple[str, str], float] = {}
+        self._attempts: dict[tuple[str, str], int] = {}
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="retry")
+        self._running = 0
+        self._thread: threading.Thread | None = None
+
+    def _entry_key(self, checker, key) -> tuple[str, str]:
+        return checker.get_name(), checker._flight_key(key)
+
+    def schedule(self, checker, key, base_delay: float = 600):
+        entry_key = self._entry_key(checker, key)
+        with self._condition:
+            attempt = self._attempts.get(entry_key, 0)
+            self._attempts[entry_key] = attempt + 1
+            delay = min(base_delay * 2 ** attempt, self.max_delay)
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+            due = time.monotonic() + delay
+            if entry_key in self._due and self._due[entry_key] <= due:
+                return
+            self._due[entry_key] = due
+            heapq.heappush(self._heap, (due, next(self._sequence), entry_key, checker, key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="retry-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def reset(self, checker, key):
+        # Called once a check is conclusive or a key leaves the rate_limited state, so its next throttle starts from the
+        # base delay again.
+        with self._condition:
+            self._attempts.pop(self._entry_key(checker, key), None)
+
+    def attempts(self, checker, key) -> int:
+        # Retries scheduled for the key since it was last reset.
+        with self._condition:
+            return self._attempts.get(self._entry_key(checker, key), 0)
+
+    def is_scheduled(self, checker, key) -> bool:
+        with self._condition:
+            return self._entry_key(checker, key) in self._due
+
+    def depth(self) -> int:
+        return len(self._due)
+
+    def running(self) -> int:
+        return self._running
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        due, _, entry_key, checker, key = heapq.heappop(self._heap)
+                        if self._due.get(entry_key) == due:
+                            del self._due[entry_key]
+                            self._running += 1
+                            break
+                        continue
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+            self._slots.acquire()
+            self._executor.submit(self._retry, checker, key)
+
+    def _retry(self, checker, key):
+        try:
+            # Retries scheduled before this process lost the retries lease are the new holder's now.
+            if get_lease("retries").held():
+                checker.verify(key)
+        except Exception as err:
+            print("Error retrying key", key, err)
+        finally:
+            with self._condition:
+                self._running -= 1
+            self._slots.release()
+
+
+_scheduler: RetryScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RetryScheduler(
+                    max_concurrent=int(os.getenv("NEKEE_RETRY_CONCURRENCY", "4")),
+                    max_delay=float(os.getenv("NEKEE_RETRY_MAX_DELAY", str(6 * 60 * 60))),
+                )
+    return _scheduler
@@ -0,0 +1,127 @@
+import codecs
+import re
+import time
+from collections import Counter
+
+try:
+    from . import metrics
+    from .candidates import LANES, LOW_PRIORITY, VERIFY, CandidateFilter
+    from .key_checker import KeyChecker
+except ImportError:
+    import os
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers import metrics
+    from key_checkers.candidates import LANES, LOW_PRIORITY, VERIFY, CandidateFilter
+    from key_checkers.key_checker import KeyChecker
+
+
+def _match_value(match: re.Match):
+    # Mirrors re.findall: the whole match, the only group, or a tuple of groups.
+    groups = match.groups()
+    if not groups:
+        return match.group(0)
+    if len(groups) == 1:
+        return groups[0]
+    return groups
+
+
+# Finds every checker's matches in a text. A pattern that starts with a literal prefix is searched on its own, which is
+# what sre's literal search is fastest at; only a checker that mixes prefixed keys with bare ones (e.g. ElevenLabs'
+# "sk_..." and bare hex keys) is split into a pass per kind, each confirmed with the full pattern.
+class KeyScanner:
+    def __init__(self, checkers: list[KeyChecker]):
+        self.checkers = list(checkers)
+        self._passes: list[list[re.Pattern]] = []
+        for checker in self.checkers:
+            unprefixed = checker.get_unprefixed_pattern()
+            if unprefixed is None or unprefixed == checker.get_regex_pattern() or not checker.KEY_PREFIXES:
+                self._passes.append([])
+                continue
+            prefixes = sorted(checker.KEY_PREFIXES, key=len, reverse=True)
+            self._passes.append([re.compile("|".join(re.escape(prefix) for prefix in prefixes)), re.compile(unprefixed)])
+
+    def iter_matches(self, text: str, pos: int = 0):
+        # Yields (checker index, start, end, key) without deduplication, per checker in non-overlapping order. Only
+        # matches starting at `pos` or later are found, but anchors and lookbehinds still see the text before it.
+        for index, checker in enumerate(self.checkers):
+            # Only the time spent searching counts, not the time the caller spends on each yielded match.
+            elapsed = 0.0
+            started = time.perf_counter()
+            for start, end, key in self._checker_matches(index, text, pos):
+                elapsed += time.perf_counter() - started
+                yield index, start, end, key
+                started = time.perf_counter()
+            metrics.extract_keys_seconds.observe(elapsed + time.perf_counter() - started, checker.get_name())
+
+    def _checker_matches(self, index: int, text: str, pos: int):
+        checker = self.checkers[index]
+        passes = self._passes[index]
+        if not passes:
+            for match in checker.compiled_regex.finditer(text, pos):
+                yield match.start(), match.end(), _match_value(match)
+            return
+        for finder in passes:
+            resume_at = 0
+            for hit in finder.finditer(text, pos):
+                if hit.start() < resume_at:
+                    continue
+                match = checker.compiled_regex.match(text, hit.start())
+                if match is not None:
+                    resume_at = max(match.end(), hit.start() + 1)
+                    yield match.start(), match.end(), _match_value(match)
+
+
+class StreamingScan:
+    def __init__(self, scanner: KeyScanner):
+        self.scanner = scanner
+        self.overlap = max((checker.MAX_KEY_LENGTH for checker in scanner.checkers), default=0)
+        self.context = CandidateFilter.CONTEXT_CHARS
+        self.found: dict[KeyChecker, list] = {checker: [] for checker in scanner.checkers}
+        # Matches that scored too low to verify right away, in the order they were first seen.
+        self.low_priority: dict[KeyChecker, dict] = {checker: {} for checker in scanner.checkers}
+        # Every distinct match, and the best lane any of its occurrences got.
+        self.lanes: dict[KeyChecker, dict] = {checker: {} for checker in scanner.checkers}
+        self._lanes = list(self.lanes.values()) # The same dicts, by checker index
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._carry = ""
+        self._scan_from = 0 # Where the carried context ends and scanning picks up again
+
+    def feed(self, chunk: bytes, final: bool = False):
+        window = self._carry + self._decoder.decode(chunk, final)
+        # A match that reaches into the last `overlap` characters may be a key cut off by the chunk boundary, so it
+        # is only accepted once the next chunk (or the end of the body) shows where it really ends. The carried text
+        # starts `context` characters early, so a deferred match still has what precedes it for its candidate score
+        # and its anchors, but that context is never scanned itself: it may begin in the middle of a token.
+        safe = len(window) if final else len(window) - self.overlap
+        keep_from = safe
+        for index, start, end, key in self.scanner.iter_matches(window, self._scan_from):
+            if end > safe:
+                keep_from = min(keep_from, start)
+            elif self._lanes[index].get(key) != VERIFY:
+                self._place(index, key, self.scanner.checkers[index].candidate_lane(window, start, end, key))
+        resume_at = max(keep_from, len(window) - 2 * self.overlap, 0)
+        carry_from = max(resume_at - self.context, 0)
+        self._carry = "" if final else window[carry_from:]
+        self._scan_from = 0 if final else resume_at - carry_from
+        if final:
+            # The same scan can go on with another document, which starts from a clean decoder.
+            self._decoder.reset()
+
+    def _place(self, index: int, key, lane: str):
+        # A key seen again in a more telling context moves up a lane, never down.
+        previous = self._lanes[index].get(key)
+        if previous is not None and LANES.index(previous) <= LANES.index(lane):
+            return
+        checker = self.scanner.checkers[index]
+        self._lanes[index][key] = lane
+        if previous == LOW_PRIORITY:
+            del self.low_priority[checker][key]
+        if lane == VERIFY:
+            self.found[checker].append(key)
+        elif lane == LOW_PRIORITY:
+            self.low_priority[checker][key] = None
+
+    def lane_counts(self) -> dict[KeyChecker, Counter]:
+        return {checker: Counter(lanes.values()) for checker, lanes in self.lanes.items()}
@@ -0,0 +1,393 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable
+
+try:
+    from .journal import KeyJournal
+    from .negative_cache import NegativeCache
+except ImportError:
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.journal import KeyJournal
+    from key_checkers.negative_cache import NegativeCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    checker TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_by_checker ON changes (checker, seq);
+CREATE TABLE IF NOT EXISTS snapshots (
+    checker TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingest (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    batch TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invalid_keys (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    checker TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    UNIQUE (checker, digest)
+);
+CREATE INDEX IF NOT EXISTS invalid_keys_by_checker ON invalid_keys (checker, seq);
+"""
+
+
+# SQLite database in WAL mode that every worker process shares when NEKEE_DATABASE is set. It holds each checker's
+# snapshot and change log, its invalid keys, the leases that make sweeps and retries run in one process only, and the
+# ingest queue.
+class SharedDatabase:
+    def __init__(self, path: str, lease_ttl: float = 30.0):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.owner = uuid.uuid4().hex # This process, as named in leases, changes and ingest batches
+        self._local = threading.local()
+        self._leases: dict[str, "Lease"] = {}
+        self._leases_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.connection().executescript(SCHEMA)
+        self.alive = self.lease(f"process:{self.owner}")
+
+    def connection(self) -> sqlite3.Connection:
+        # One connection per thread; statements run in autocommit mode unless a transaction is opened explicitly.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lease(self, name: str) -> "Lease":
+        with self._leases_lock:
+            lease = self._leases.get(name)
+            if lease is not None:
+                return lease
+            lease = self._leases[name] = Lease(self, name)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._renew_leases, name="lease-renewal", daemon=True)
+                self._thread.start()
+        lease.renew()
+        return lease
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._leases_lock:
+                leases = list(self._leases.values())
+            for lease in leases:
+                lease.renew()
+
+
+# Held by at most one process at a time. The holder renews it every third of the TTL; if it stops (it crashed or
+# hung), another process takes it over once the TTL has run out.
+class Lease:
+    def __init__(self, database: SharedDatabase | None, name: str):
+        self.database = database
+        self.name = name
+        self._valid_until = float("inf") if database is None else 0.0
+        self._callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def held(self) -> bool:
+        return time.time() < self._valid_until
+
+    def on_acquired(self, callback: Callable[[], None]):
+        # Called every time this process becomes the holder, and right away if it already is.
+        with self._lock:
+            self._callbacks.append(callback)
+        if self.held():
+            callback()
+
+    def renew(self):
+        was_held = self.held()
+        now = time.time()
+        try:
+            cursor = self.database.connection().execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (self.name, self.database.owner, now + self.database.lease_ttl, now),
+            )
+            acquired = cursor.rowcount > 0
+        except sqlite3.Error as err:
+            print("Error renewing lease", self.name, err)
+            acquired = False
+        if not acquired:
+            self._valid_until = 0.0
+            if was_held:
+                print("Lost lease", self.name)
+            return
+        # Stop acting a little before the lease runs out in the database, so two holders never overlap.
+        self._valid_until = now + self.database.lease_ttl * 0.8
+        if not was_held:
+            with self._lock:
+                callbacks = list(self._callbacks)
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as err:
+                    print("Error taking over lease", self.name, err)
+
+
+# Drop-in for KeyJournal that keeps a checker's snapshot and changes in the shared database. Changes made by other
+# processes are polled and applied through `apply_changes`; a process that fell behind a compaction reloads.
+class SqliteJournal:
+    def __init__(
+        self,
+        database: SharedDatabase,
+        checker: str,
+        import_path: str,
+        apply_changes: Callable[[list[dict], dict | None], None],
+        lock: Callable,
+        poll_interval: float = 1.0,
+        compact_after: int = 10_000,
+        compact_interval: float = 600.0,
+    ):
+        self.database = database
+        self.checker = checker
+        self.import_path = import_path
+        self.apply_changes = apply_changes
+        self.lock = lock # The checker's store write lock; local writes append their change while holding it
+        self.poll_interval = poll_interval
+        self.compact_after = compact_after
+        self.compact_interval = compact_interval
+        self._last_seq = 0 # Every change up to here is reflected in this process's store
+        self._own: dict[tuple, int] = {} # (kind, key) -> seq of this process's latest change not polled past yet
+        self._records_since_compaction = 0
+        self._last_compaction = time.monotonic()
+        self._snapshot_fn: Callable[[], dict] | None = None
+
+    def _conflict(self, record: dict) -> tuple:
+        # Changes to the same key only override each other within one kind: status, verification time or a set.
+        op = record.get("op")
+        kind = "status" if op in ("set", "delete") else record.get("set") if op in ("add", "discard") else op
+        return kind, record.get("key")
+
+    def _import(self, conn: sqlite3.Connection):
+        # The first process to use the database brings in what the checker's JSON snapshot and journal held.
+        data, records = KeyJournal(self.import_path).load()
+        if data is None and not records:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            exists = conn.execute("SELECT 1 FROM snapshots WHERE checker = ?", (self.checker,)).fetchone()
+            if exists is None:
+                conn.execute("INSERT INTO snapshots (checker, seq, data) VALUES (?, 0, ?)", (self.checker, json.dumps(data or {})))
+                conn.executemany(
+                    "INSERT INTO changes (checker, origin, record) VALUES (?, ?, ?)",
+                    [(self.checker, "import", json.dumps(record, ensure_ascii=False)) for record in records],
+                )
+            conn.execute("COMMIT")
+            print("Imported", self.checker, "keys from", self.import_path)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def load(self) -> tuple[dict | None, list[dict]]:
+        conn = self.database.connection()
+        if conn.execute("SELECT 1 FROM snapshots WHERE checker = ?", (self.checker,)).fetchone() is None:
+            self._import(conn)
+        row = conn.execute("SELECT seq, data FROM snapshots WHERE checker = ?", (self.checker,)).fetchone()
+        data = None
+        self._last_seq = 0
+        if row is not None:
+            self._last_seq = row[0]
+            data = json.loads(row[1])
+        records = []
+        for seq, record in conn.execute(
+            "SELECT seq, record FROM changes WHERE checker = ? AND seq > ? ORDER BY seq", (self.checker, self._last_seq)
+        ):
+            records.append(json.loads(record))
+            self._last_seq = seq
+        self._records_since_compaction = len(records)
+        self._own.clear()
+        return data, records
+
+    def start(self, snapshot_fn: Callable[[], dict]):
+        self._snapshot_fn = snapshot_fn
+        thread = threading.Thread(target=self._run, name=f"journal-{self.checker}", daemon=True)
+        thread.start()
+
+    def append(self, record: dict):
+        # Each change is its own transaction, committed before the write lock is released.
+        cursor = self.database.connection().execute(
+            "INSERT INTO changes (checker, origin, record) VALUES (?, ?, ?)",
+            (self.checker, self.database.owner, json.dumps(record, ensure_ascii=False, separators=(",", ":"))),
+        )
+        self._own[self._conflict(record)] = cursor.lastrowid
+        self._records_since_compaction += 1
+
+    def flush(self):
+        pass
+
+    def poll(self):
+        conn = self.database.connection()
+        row = conn.execute("SELECT seq FROM snapshots WHERE checker = ?", (self.checker,)).fetchone()
+        behind = row is not None and row[0] > self._last_seq
+        if not behind and conn.execute(
+            "SELECT 1 FROM changes WHERE checker = ? AND seq > ? AND origin != ? LIMIT 1",
+            (self.checker, self._last_seq, self.database.owner),
+        ).fetchone() is None:
+            return
+        with self.lock():
+            if behind:
+                # Changes this process hadn't seen yet were compacted away, so start over from the shared snapshot.
+                data, records = self.load()
+                self.apply_changes(records, data or {})
+                return
+            changes = []
+            for seq, origin, record in conn.execute(
+                "SELECT seq, origin, record FROM changes WHERE checker = ? AND seq > ? ORDER BY seq",
+                (self.checker, self._last_seq),
+            ):
+                self._last_seq = seq
+                if origin == self.database.owner:
+                    continue
+                record = json.loads(record)
+                # A change this process made later than another process's one wins, as it does in the database.
+                if self._own.get(self._conflict(record), 0) < seq:
+                    changes.append(record)
+            self._own = {conflict: seq for conflict, seq in self._own.items() if seq > self._last_seq}
+            self._records_since_compaction += len(changes)
+            if changes:
+                self.apply_changes(changes, None)
+
+    def compact(self):
+        if self._snapshot_fn is None:
+            return
+        conn = self.database.connection()
+        with self.lock():
+            # Holding the lock keeps this process's own writes out, so the snapshot is exactly the state at `seq`.
+            self.poll()
+            seq = max([self._last_seq, *self._own.values()])
+            data = json.dumps(self._snapshot_fn(), ensure_ascii=False)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO snapshots (checker, seq, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (checker) DO UPDATE SET seq = excluded.seq, data = excluded.data WHERE excluded.seq > snapshots.seq",
+                (self.checker, seq, data),
+            )
+            conn.execute("DELETE FROM changes WHERE checker = ? AND seq <= (SELECT seq FROM snapshots WHERE checker = ?)", (self.checker, self.checker))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._last_seq = max(self._last_seq, seq)
+        self._own = {conflict: own_seq for conflict, own_seq in self._own.items() if own_seq > self._last_seq}
+        self._records_since_compaction = 0
+        self._last_compaction = time.monotonic()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+                if self._records_since_compaction >= self.compact_after or (
+                    self._records_since_compaction
+                    and time.monotonic() - self._last_compaction >= self.compact_interval
+                ):
+                    self.compact()
+            except Exception as err:
+                print("Error syncing", self.checker, "with", self.database.path, err)
+
+
+# NegativeCache kept in the shared database, so an invalid key one process found is skipped by every other one. Each
+# process still answers from memory and only looks for other processes' entries on a miss, at most once per
+# poll_interval. Entries in an existing .invalid file aren't imported; those keys just get checked once more.
+class SqliteNegativeCache(NegativeCache):
+    def __init__(
+        self,
+        database: SharedDatabase,
+        checker: str,
+        ttl: float = 7 * 24 * 60 * 60,
+        max_entries: int = 100_000,
+        poll_interval: float = 1.0,
+        purge_interval: float = 3600.0,
+    ):
+        self.database = database
+        self.checker = checker
+        self.path = database.path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self.purge_interval = purge_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_seq = 0
+        self._last_poll = 0.0
+        self._last_purge = 0.0
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        try:
+            conn = self.database.connection()
+            if now - self._last_purge >= self.purge_interval:
+                conn.execute("DELETE FROM invalid_keys WHERE checker = ? AND expires_at <= ?", (self.checker, time.time()))
+                self._last_purge = now
+            for seq, digest, expires_at in conn.execute(
+                "SELECT seq, digest, expires_at FROM invalid_keys WHERE checker = ? AND seq > ? ORDER BY seq",
+                (self.checker, self._last_seq),
+            ):
+                self._last_seq = seq
+                self._remember(bytes(digest), expires_at)
+        except Exception as err:
+            print("Error reading", self.checker, "invalid keys from", self.path, err)
+
+    def _persist(self, digest: bytes, expires_at: float):
+        # Replacing the row gives it a new seq, so other processes pick up the later expiry too.
+        self.database.connection().execute(
+            "INSERT OR REPLACE INTO invalid_keys (checker, digest, expires_at) VALUES (?, ?, ?)",
+            (self.checker, digest, expires_at),
+        )
+
+
+_database: SharedDatabase | None = None
+_database_lock = threading.Lock()
+_local_leases: dict[str, Lease] = {}
+
+
+def get_database() -> SharedDatabase | None:
+    # None unless NEKEE_DATABASE is set, in which case this process shares its state with every other one using it.
+    global _database
+    path = os.getenv("NEKEE_DATABASE")
+    if not path:
+        return None
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = SharedDatabase(path, lease_ttl=float(os.getenv("NEKEE_LEASE_TTL", "30")))
+    return _database
+
+
+def get_lease(name: str) -> Lease:
+    # Without a shared database this is the only process, and it holds every lease.
+    database = get_database()
+    if database is not None:
+        return database.lease(name)
+    with _database_lock:
+        return _local_leases.setdefault(name, Lease(None, name))
@@ -0,0 +1,64 @@
+import datetime
+import hashlib
+import hmac
+import urllib.parse
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sign_request(
+    method: str,
+    url: str,
+    headers: dict[str, str],
+    body: bytes,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    service: str,
+    now: datetime.datetime | None = None,
+) -> dict[str, str]:
+    # AWS Signature Version 4, returning a copy of headers with Host, X-Amz-Date and Authorization added.
+    parts = urllib.parse.urlsplit(url)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date_stamp = now.strftime("%Y%m%d")
+
+    signed = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed["host"] = parts.netloc
+    signed["x-amz-date"] = amz_date
+    signed_headers = ";".join(sorted(signed))
+    canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in sorted(signed))
+    # Services other than S3 expect the already-encoded path to be encoded once more.
+    canonical_uri = urllib.parse.quote(parts.path or "/", safe="/~")
+    canonical_query = "&".join(
+        f"{urllib.parse.quote(name, safe='~')}={urllib.parse.quote(value, safe='~')}"
+        for name, value in sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    )
+    canonical_request = "\n".join([
+        method.upper(),
+        canonical_uri,
+        canonical_query,
+        canonical_headers,
+        signed_headers,
+        hashlib.sha256(body or b"").hexdigest(),
+    ])
+
+    scope = f"{date_stamp}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    signing_key = _hmac(_hmac(_hmac(_hmac(f"AWS4{secret_key}".encode("utf-8"), date_stamp), region), service), "aws4_request")
+    signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    signed_request_headers = dict(headers)
+    signed_request_headers["Host"] = parts.netloc
+    signed_request_headers["X-Amz-Date"] = amz_date
+    signed_request_headers["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}"
+    )
+    return signed_request_headers
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+try:
+    from .key_checker import KeyChecker, storage_path
+    from .shared_store import get_lease
+except ImportError:
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from key_checkers.key_checker import KeyChecker, storage_path
+    from key_checkers.shared_store import get_lease
+
+
+# Periodic re-verification of a set of keys, optionally only those `is_due` before the next sweep starts. Each
+# sweep starts with the keys verified longest ago and spreads their starts over `spread` of the interval with at
+# most `concurrency` in flight. Progress is kept in storage/sweep_<name>.json; after a restart, a sweep whose
+# interval hasn't elapsed picks up where it was, skipping keys verified since it started. With several worker
+# processes, only the one holding the sweep's lease runs it, and whoever takes the lease over resumes the same way.
+class Sweep:
+    def __init__(
+        self,
+        name: str,
+        interval: float,
+        checkers: list[KeyChecker],
+        keys_of: Callable[[KeyChecker], object],
+        is_due: Callable[[KeyChecker, str, float], bool] | None = None,
+        concurrency: int = 4,
+        spread: float = 0.8,
+        run_at_startup: bool = False,
+    ):
+        self.name = name
+        self.interval = interval
+        self.checkers = checkers
+        self.keys_of = keys_of
+        self.is_due = is_due
+        self.concurrency = concurrency
+        self.spread = spread
+        self.run_at_startup = run_at_startup
+        self.state_path = storage_path(f"sweep_{name}.json")
+        self.lease = get_lease(f"sweep:{name}")
+        self._state = self._load_state()
+        self._lock = threading.Lock()
+        self._last_saved = 0.0
+        self._thread: threading.Thread | None = None
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+                if isinstance(state, dict):
+                    return state
+        except FileNotFoundError:
+            pass
+        except Exception as err:
+            print("Error loading sweep state", self.state_path, err)
+        return {}
+
+    def _save_state(self):
+        try:
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f)
+            os.replace(tmp_path, self.state_path)
+            self._last_saved = time.monotonic()
+        except Exception as err:
+            print("Error saving sweep state", self.state_path, err)
+
+    def progress(self) -> dict:
+        with self._lock:
+            return dict(self._state)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_forever, name=f"sweep-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _wait_for_lease(self):
+        if self.lease.held():
+            return
+        while not self.lease.held():
+            time.sleep(5)
+        # The previous holder may have got further with the sweep than this process last saw.
+        with self._lock:
+            self._state = self._load_state()
+
+    def _run_forever(self):
+        while True:
+            self._wait_for_lease()
+            started_at = self._state.get("started_at")
+            if started_at and not self._state.get("finished_at") and time.time() - started_at < self.interval:
+                print("Resuming", self.name, "sweep from", self._state.get("completed", 0), "of", self._state.get("total", 0))
+            else:
+                if started_at:
+                    next_start = started_at + self.interval
+                elif self.run_at_startup:
+                    next_start = time.time()
+                else:
+                    next_start = time.time() + self.interval
+                time.sleep(max(0.0, next_start - time.time()))
+                if not self.lease.held():
+                    continue
+                started_at = time.time()
+                with self._lock:
+                    self._state = {"started_at": started_at, "finished_at": None, "total": 0, "completed": 0}
+            try:
+                self._sweep(started_at)
+            except Exception as err:
+                print("Error during", self.name, "sweep", err)
+                time.sleep(60)
+
+    def _sweep(self, started_at: float):
+        items = [
+            (checker, key)
+            for checker in self.checkers
+            for key in list(self.keys_of(checker))
+            if checker.last_verified_at(key) < started_at
+            and (self.is_due is None or self.is_due(checker, key, started_at + self.interval))
+        ]
+        items.sort(key=lambda item: item[0].last_verified_at(item[1]))
+        with self._lock:
+            self._state["total"] = self._state.get("completed", 0) + len(items)
+            self._save_state()
+
+        # Item i is due i/N of the way through the time left, so the first one goes out right away and the last one
+        # a slot before the deadline. A slow stretch only catches up as fast as the concurrency slots allow.
+        begin = time.time()
+        step = max(0.0, started_at + self.interval * self.spread - begin) / max(len(items), 1)
+        slots = threading.BoundedSemaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"sweep-{self.name}") as executor:
+            for index, (checker, key) in enumerate(items):
+                time.sleep(max(0.0, begin + index * step - time.time()))
+                if not self.lease.held():
+                    break
+                slots.acquire()
+                executor.submit(self._verify, checker, key, slots)
+
+        if not self.lease.held():
+            # Left unfinished for the process that holds the lease now.
+            print("Handing", self.name, "sweep over after", self._state.get("completed", 0), "of", self._state["total"], "keys")
+            return
+        with self._lock:
+            self._state["finished_at"] = time.time()
+            self._save_state()
+        print("Finished", self.name, "sweep of", self._state["total"], "keys")
+
+    def _verify(self, checker: KeyChecker, key: str, slots: threading.BoundedSemaphore):
+        try:
+            if key in self.keys_of(checker):
+                checker.verify(key)
+        except Exception as err:
+            print("Error verifying key", key, "during", self.name, "sweep", err)
+        finally:
+            slots.release()
+            with self._lock:
+                self._state["completed"] = self._state.get("completed", 0) + 1
+                completed, total = self._state["completed"], self._state["total"]
+                if time.monotonic() - self._last_saved >= 30 or completed == total:
+                    self._save_state()
+            if total and completed * 10 // total != (completed - 1) * 10 // total:
+                print(self.name.capitalize(), "sweep progress:", completed, "/", total)
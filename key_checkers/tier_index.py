@@ -0,0 +1,80 @@
+import random
+import threading
+
+# Tiers that are kept but never handed out unless asked for by name: dead keys, and live keys still waiting for
+# enrichment to find their tier.
+UNSERVED_TIERS = frozenset(("dead", "pending"))
+
+
+# Keys grouped by lower-cased tier, each bucket a list plus positions so keys can be swap-removed and
+# picked at random in O(1). The None bucket holds every key whose tier isn't in UNSERVED_TIERS.
+class TierIndex:
+    def __init__(self):
+        self._buckets: dict[str | None, list[str]] = {}
+        self._positions: dict[str | None, dict[str, int]] = {}
+        self._labels: dict[str, str] = {}
+        self._tier_of: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _normalize(self, tier) -> str:
+        return str(tier).lower()
+
+    def _add(self, bucket: str | None, key: str):
+        keys = self._buckets.setdefault(bucket, [])
+        self._positions.setdefault(bucket, {})[key] = len(keys)
+        keys.append(key)
+
+    def _discard(self, bucket: str | None, key: str):
+        positions = self._positions.get(bucket)
+        if not positions or key not in positions:
+            return
+        keys = self._buckets[bucket]
+        index = positions.pop(key)
+        last = keys.pop()
+        if last != key:
+            keys[index] = last
+            positions[last] = index
+        if not keys:
+            del self._buckets[bucket]
+            del self._positions[bucket]
+            if bucket is not None:
+                self._labels.pop(bucket, None)
+
+    def set(self, key: str, tier: str):
+        normalized = self._normalize(tier)
+        with self._lock:
+            previous = self._tier_of.get(key)
+            if previous == normalized:
+                return
+            if previous is not None:
+                self._discard(previous, key)
+                if previous not in UNSERVED_TIERS:
+                    self._discard(None, key)
+            self._tier_of[key] = normalized
+            self._labels.setdefault(normalized, str(tier))
+            self._add(normalized, key)
+            if normalized not in UNSERVED_TIERS:
+                self._add(None, key)
+
+    def remove(self, key: str):
+        with self._lock:
+            previous = self._tier_of.pop(key, None)
+            if previous is None:
+                return
+            self._discard(previous, key)
+            self._discard(None, key)
+
+    def random_key(self, tier=None) -> str | None:
+        bucket = None if tier is None else self._normalize(tier)
+        with self._lock:
+            keys = self._buckets.get(bucket)
+            return random.choice(keys) if keys else None
+
+    def count(self, tier=None) -> int:
+        bucket = None if tier is None else self._normalize(tier)
+        with self._lock:
+            return len(self._buckets.get(bucket, ()))
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            return {self._labels[bucket]: len(keys) for bucket, keys in self._buckets.items() if bucket is not None}
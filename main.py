@@ -1,13 +1,22 @@
+import asyncio
+import base64
+import bisect
+import gzip
+import hashlib
 import json
 import os
 import secrets
-from typing import Any
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable
 
 from dotenv import load_dotenv
-from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request, Response, status
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi_utils.tasks import repeat_every
 
 from key_checkers.openai import OpenAIKeyChecker
 from key_checkers.anthropic import AnthropicKeyChecker
@@ -15,6 +24,13 @@ from key_checkers.google import GoogleKeyChecker
 from key_checkers.elevenlabs import ElevenLabsKeyChecker
 from key_checkers.openrouter import OpenRouterKeyChecker
 from key_checkers.aws import AWSKeyChecker
+from key_checkers import ingest, metrics
+from key_checkers.ingest_queue import FileQueueLog, IngestQueue, QueueFull, SqliteQueueLog
+from key_checkers.key_checker import get_enrichment_queue, get_low_priority_lane, storage_path, verify_queue_depth
+from key_checkers.retry_scheduler import get_retry_scheduler
+from key_checkers.scanner import KeyScanner, StreamingScan
+from key_checkers.shared_store import get_database, get_lease
+from key_checkers.sweeper import Sweep
 
 load_dotenv()
 
@@ -24,16 +40,35 @@ USERNAME = os.getenv("NEKEE_USERNAME", "admin")
 if not PASSWORD:
     raise RuntimeError("NEKEE_PASSWORD must be set in the environment")
 
+SCAN_CHUNK_SIZE = int(os.getenv("NEKEE_SCAN_CHUNK_SIZE", str(1024 * 1024)))
+MAX_BODY_SIZE = int(os.getenv("NEKEE_MAX_BODY_SIZE", str(1024 * 1024 * 1024))) # Decoded bytes scanned per /data request
+COMPACT_JSON = os.getenv("NEKEE_COMPACT_JSON", "").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("NEKEE_RESPONSE_CACHE_SIZE", "256"))
+GZIP_MIN_SIZE = int(os.getenv("NEKEE_GZIP_MIN_SIZE", "1024")) # Smaller bodies are never compressed; 0 turns gzip off
+LIST_PAGE_MAX = int(os.getenv("NEKEE_LIST_PAGE_MAX", "10000"))
+NDJSON_BATCH = 1000 # Keys encoded per chunk of a streamed listing
+SCAN_CONCURRENCY = int(os.getenv("NEKEE_SCAN_CONCURRENCY", "8")) # /data bodies decoded and scanned at once
+
+
+# /data scans get threads of their own: they block on the upload for as long as it lasts, and would starve the default
+# executor the upload itself (and everything else) relies on.
+scan_executor = ThreadPoolExecutor(max_workers=SCAN_CONCURRENCY, thread_name_prefix="scan")
+scan_slots = threading.BoundedSemaphore(SCAN_CONCURRENCY)
+
+
+def _encode_json(content: Any, compact: bool = False) -> bytes:
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None if compact else 2,
+        separators=(",", ":") if compact else (", ", ": "),
+    ).encode("utf-8")
+
 
 class PrettyJSONResponse(JSONResponse):
     def render(self, content: Any) -> bytes:  # type: ignore[override]
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=2,
-            separators=(", ", ": "),
-        ).encode("utf-8")
+        return _encode_json(content)
 
 
 app = FastAPI(default_response_class=PrettyJSONResponse)
@@ -47,6 +82,104 @@ key_checkers = [
     OpenRouterKeyChecker(),
     AWSKeyChecker(),
 ]
+key_scanner = KeyScanner(key_checkers)
+database = get_database()
+ingest_queue = IngestQueue(
+    SqliteQueueLog(database) if database is not None else FileQueueLog(
+        storage_path("ingest_queue.log"), fsync_interval=float(os.getenv("NEKEE_JOURNAL_FSYNC_INTERVAL", "1"))
+    ),
+    key_checkers,
+    max_batches=int(os.getenv("NEKEE_INGEST_QUEUE_BATCHES", "10000")),
+    max_keys=int(os.getenv("NEKEE_INGEST_QUEUE_KEYS", "100000")),
+    workers=int(os.getenv("NEKEE_INGEST_WORKERS", "4")),
+)
+
+SWEEP_CONCURRENCY = int(os.getenv("NEKEE_SWEEP_CONCURRENCY", "4"))
+sweeps = [
+    Sweep(
+        "monthly",
+        60 * 60 * 24 * 2,
+        key_checkers,
+        keys_of=lambda checker: checker.monthly_usage_reached_keys,
+        concurrency=SWEEP_CONCURRENCY,
+        run_at_startup=True,
+    ),
+    # Runs often but only picks keys whose adaptive re-verification interval runs out before the next pass.
+    Sweep(
+        "reverify",
+        60 * 60 * 3,
+        key_checkers,
+        keys_of=lambda checker: checker.keys,
+        is_due=lambda checker, key, horizon: checker.reverify_due_at(key) <= horizon,
+        concurrency=SWEEP_CONCURRENCY,
+    ),
+]
+
+
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_keys",
+    "Stored keys, by tier.",
+    ("checker", "tier"),
+    lambda: [
+        ((checker.get_name(), tier), count)
+        for checker in key_checkers
+        for tier, count in sorted(checker.count_keys_by_tiers().items())
+    ],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_verifications_in_flight",
+    "Verifications started or queued and not finished yet.",
+    ("checker",),
+    lambda: [((checker.get_name(),), checker.verifications_in_flight()) for checker in key_checkers],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_verify_queue_depth",
+    "Verifications waiting for a free worker.",
+    (),
+    lambda: [((), verify_queue_depth())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_ingest_queue_batches",
+    "/data batches accepted and not fully verified yet.",
+    (),
+    lambda: [((), ingest_queue.depth())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_ingest_queue_keys",
+    "Keys waiting in the ingest queue.",
+    (),
+    lambda: [((), ingest_queue.pending_keys())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_enrichment_queue_depth",
+    "Live keys waiting for their tier to be looked up.",
+    (),
+    lambda: [((), get_enrichment_queue().depth())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_enrichments_running",
+    "Tier lookups running right now.",
+    (),
+    lambda: [((), get_enrichment_queue().running())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_low_priority_queue_depth",
+    "Low-confidence candidates waiting to be verified when nothing else is.",
+    (),
+    lambda: [((), get_low_priority_lane().depth())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_retry_queue_depth",
+    "Rate-limited keys waiting for their retry.",
+    (),
+    lambda: [((), get_retry_scheduler().depth())],
+))
+metrics.REGISTRY.register(metrics.GaugeCallback(
+    "nekee_retries_running",
+    "Retries being verified right now.",
+    (),
+    lambda: [((), get_retry_scheduler().running())],
+))
 
 
 async def _require_password(credentials: HTTPBasicCredentials = Depends(security)) -> None:
@@ -60,37 +193,194 @@ async def _require_password(credentials: HTTPBasicCredentials = Depends(security
         )
 
 
+# Encoded response bodies keyed by endpoint and encoding: [store versions it was built from, body, ETag, gzipped body].
+_response_cache: OrderedDict[tuple, list] = OrderedDict()
+
+
+def _accepts_gzip(request: Request) -> bool:
+    if GZIP_MIN_SIZE <= 0:
+        return False
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def _cached_json(request: Request, cache_key: Hashable, version: Hashable, build: Callable[[], Any], compact: bool | None) -> Response:
+    # Bodies are rebuilt only when a store version changed, and clients that send back the ETag get a 304. The ETag
+    # hashes the body rather than the versions, which start over when the process restarts.
+    compact = COMPACT_JSON if compact is None else compact
+    entry = _response_cache.get((cache_key, compact))
+    if entry is None or entry[0] != version:
+        body = await asyncio.to_thread(lambda: _encode_json(build(), compact))
+        entry = [version, body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', None]
+        _response_cache[(cache_key, compact)] = entry
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    else:
+        _response_cache.move_to_end((cache_key, compact))
+    _, body, etag, gzipped = entry
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    use_gzip = len(body) >= GZIP_MIN_SIZE and _accepts_gzip(request)
+    if use_gzip:
+        # Each encoding is its own representation, so the compressed one gets its own ETag.
+        headers["ETag"] = etag[:-1] + '-gzip"'
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if use_gzip:
+        if gzipped is None:
+            gzipped = entry[3] = await asyncio.to_thread(gzip.compress, body, 6)
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=gzipped, media_type="application/json", headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @app.get("/", dependencies=[Depends(_require_password)])
-async def root():
-    summary = {}
-    for checker in key_checkers:
-        active_keys = checker.list_keys_by_tiers()
-        count = sum(len(keys) for keys in active_keys.values())
-        if count == 0 and len(checker.monthly_usage_reached_keys) == 0:
-            continue
-        summary[checker.get_name()] = {
-            "count": count,
-            "keys": active_keys,
-            "keys_with_special_features": list(checker.keys_with_special_features),
-            # "usage_reached_keys": list(checker.monthly_usage_reached_keys),
-        }
-    return summary
+async def root(request: Request, compact: bool | None = None):
+    # One snapshot per checker, so the count, tiers and feature list all describe the same moment.
+    snapshots = [(checker, checker.snapshot()) for checker in key_checkers]
+
+    def build():
+        summary = {}
+        for checker, snapshot in snapshots:
+            count = snapshot.count()
+            if count == 0 and len(snapshot.monthly_usage_reached_keys) == 0:
+                continue
+            summary[checker.get_name()] = {
+                "count": count,
+                "keys": snapshot.by_tier(),
+                "keys_with_special_features": list(snapshot.keys_with_special_features),
+                # "usage_reached_keys": list(checker.monthly_usage_reached_keys),
+            }
+        return summary
+
+    return await _cached_json(request, ("summary",), tuple(snapshot.version for _, snapshot in snapshots), build, compact)
+
+
+def _queue_full_response(retry_after: int, detail: str = "ingest queue is full") -> HTTPException:
+    metrics.ingest_rejected.inc()
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+async def _scan_and_verify(request: Request, reverify: bool):
+    # The body is decoded (gzip/zstd, tar/zip/NDJSON) and scanned on a worker thread while it's still being uploaded.
+    # The keys found in the whole batch go to the ingest queue, and the 204 means they're on disk and will be
+    # verified even if the server restarts first.
+    if ingest_queue.full():
+        raise _queue_full_response(ingest_queue.retry_after())
+    # Each scan holds one of the scan executor's threads for the whole upload, so once they're all taken the request
+    # is turned away rather than queued behind them.
+    if not scan_slots.acquire(blocking=False):
+        raise _queue_full_response(1, "too many uploads being scanned")
+    try:
+        await _stream_and_scan(request, reverify)
+    finally:
+        scan_slots.release()
+
+
+async def _stream_and_scan(request: Request, reverify: bool):
+    loop = asyncio.get_running_loop()
+    scan = StreamingScan(key_scanner)
+    pipe = ingest.ChunkPipe(loop)
+
+    def decode_and_scan() -> int:
+        try:
+            return ingest.scan_body(
+                scan,
+                pipe,
+                request.headers.get("content-encoding", ""),
+                request.headers.get("content-type", ""),
+                SCAN_CHUNK_SIZE,
+                MAX_BODY_SIZE,
+            )
+        finally:
+            pipe.close()
+
+    started = time.perf_counter()
+    worker = loop.run_in_executor(scan_executor, decode_and_scan)
+    worker.add_done_callback(lambda task: task.cancelled() or task.exception())
+    buffer = bytearray()
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) >= SCAN_CHUNK_SIZE:
+                if not await pipe.put(bytes(buffer)):
+                    break
+                buffer.clear()
+        else:
+            if buffer:
+                await pipe.put(bytes(buffer))
+    except BaseException:
+        pipe.close()
+        raise
+    finally:
+        pipe.finish()
+    scanned = await worker
+    metrics.scan_seconds.observe(time.perf_counter() - started)
+    metrics.scanned_bytes.inc(amount=scanned)
+    try:
+        await asyncio.to_thread(ingest_queue.put, scan.found, reverify)
+    except QueueFull as err:
+        raise _queue_full_response(err.retry_after)
+    await asyncio.to_thread(_queue_low_priority, scan, reverify)
+
+
+def _queue_low_priority(scan: StreamingScan, reverify: bool):
+    # Matches that only look like keys by their shape are verified in the background once nothing else is waiting.
+    low_priority_lane = get_low_priority_lane()
+    for checker, lanes in scan.lane_counts().items():
+        for lane, count in lanes.items():
+            metrics.candidates.inc(checker.get_name(), lane, amount=count)
+    for checker, matches in scan.low_priority.items():
+        for key in checker._keys_to_verify(matches, reverify):
+            if not low_priority_lane.submit(checker, key):
+                metrics.low_priority_rejected.inc(checker.get_name())
 
 
 @app.post("/data", status_code=status.HTTP_204_NO_CONTENT)
-async def receive_text(request: Request, background_tasks: BackgroundTasks):
-    text = (await request.body()).decode('utf-8')
-    for checker in key_checkers:
-        background_tasks.add_task(checker.check_text, text, reverify=False)
+async def receive_text(request: Request):
+    await _scan_and_verify(request, reverify=False)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.post("/data/reverify", status_code=status.HTTP_204_NO_CONTENT)
-async def receive_text(request: Request, background_tasks: BackgroundTasks):
-    text = (await request.body()).decode('utf-8')
-    for checker in key_checkers:
-        background_tasks.add_task(checker.check_text, text, reverify=True)
+async def receive_text(request: Request):
+    await _scan_and_verify(request, reverify=True)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@app.get("/status", dependencies=[Depends(_require_password)])
+async def service_status():
+    retry_scheduler = get_retry_scheduler()
+    return {
+        "ingest_queue_batches": ingest_queue.depth(),
+        "ingest_queue_keys": ingest_queue.pending_keys(),
+        "ingest_batches_running": ingest_queue.running(),
+        "enrichment_queue_depth": get_enrichment_queue().depth(),
+        "enrichments_running": get_enrichment_queue().running(),
+        "low_priority_queue_depth": get_low_priority_lane().depth(),
+        "retry_queue_depth": retry_scheduler.depth(),
+        "retries_running": retry_scheduler.running(),
+        "sweeps": {sweep.name: sweep.progress() for sweep in sweeps},
+        "leases_held": [name for name in ["retries", "enrichment"] + [sweep.lease.name for sweep in sweeps] if get_lease(name).held()],
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(_require_password)])
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 def _get_checker_or_404(name: str):
     for c in key_checkers:
         if c.get_name() == name:
@@ -98,14 +388,94 @@ def _get_checker_or_404(name: str):
     raise HTTPException(status_code=404, detail="checker not found")
 
 
+def _encode_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _ndjson_chunks(snapshot, keys: tuple[str, ...], start: int, end: int, compress: bool):
+    # Encodes a batch at a time straight from the snapshot, so a full listing never sits in memory as one document.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    for offset in range(start, end, NDJSON_BATCH):
+        chunk = "".join(
+            json.dumps({"key": key, "tier": snapshot.tier_of(key)}, ensure_ascii=False) + "\n"
+            for key in keys[offset:min(offset + NDJSON_BATCH, end)]
+        ).encode("utf-8")
+        yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+
+async def _list_response(request: Request, checker_name: str, tier: str | None, cursor: str | None, limit: int | None, output: str, compact: bool | None):
+    snapshot = _get_checker_or_404(checker_name).snapshot()
+    ndjson = output == "ndjson" or (output == "json" and "application/x-ndjson" in request.headers.get("accept", ""))
+    if output not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if cursor is None and limit is None and not ndjson:
+        if tier is None:
+            return await _cached_json(request, ("list", checker_name), snapshot.version, snapshot.by_tier, compact)
+        return await _cached_json(
+            request, ("list", checker_name, tier.lower()), snapshot.version, lambda: list(snapshot.list_keys(tier)), compact
+        )
+
+    # Pages run over the keys in sorted order and the cursor is the last key of the previous page, so clients can
+    # resume a sync even after keys were added or removed in between.
+    keys = snapshot.sorted_keys(tier)
+    start = bisect.bisect_right(keys, _decode_cursor(cursor)) if cursor else 0
+    end = len(keys) if limit is None else min(start + limit, len(keys))
+    next_cursor = _encode_cursor(keys[end - 1]) if end < len(keys) and end > start else None
+
+    if ndjson:
+        compress = _accepts_gzip(request)
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(
+            _ndjson_chunks(snapshot, keys, start, end, compress), media_type="application/x-ndjson", headers=headers
+        )
+
+    def build():
+        page = keys[start:end]
+        return {
+            "keys": list(page) if tier is not None else [{"key": key, "tier": snapshot.tier_of(key)} for key in page],
+            "next_cursor": next_cursor,
+        }
+
+    cache_key = ("page", checker_name, None if tier is None else tier.lower(), cursor, limit)
+    return await _cached_json(request, cache_key, snapshot.version, build, compact)
+
+
 @app.get("/list/{checker_name}", dependencies=[Depends(_require_password)])
-async def list_checker_tiers(checker_name: str):
-    return  _get_checker_or_404(checker_name).list_keys_by_tiers()
+async def list_checker_tiers(
+    request: Request,
+    checker_name: str,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=LIST_PAGE_MAX),
+    format: str = "json",
+    compact: bool | None = None,
+):
+    return await _list_response(request, checker_name, None, cursor, limit, format, compact)
 
 
 @app.get("/list/{checker_name}/{tier}", dependencies=[Depends(_require_password)])
-async def list_checker_by_tier(checker_name: str, tier: str):
-    return _get_checker_or_404(checker_name).list_keys(tier)
+async def list_checker_by_tier(
+    request: Request,
+    checker_name: str,
+    tier: str,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=LIST_PAGE_MAX),
+    format: str = "json",
+    compact: bool | None = None,
+):
+    return await _list_response(request, checker_name, tier, cursor, limit, format, compact)
 
 
 @app.get("/{checker_name}", dependencies=[Depends(_require_password)])
@@ -118,15 +488,7 @@ async def get_random_key_by_tier(checker_name: str, tier: str):
     return _get_checker_or_404(checker_name).get_key(tier)
 
 @app.on_event("startup")
-@repeat_every(seconds=60 * 60 * 24 * 2, wait_first=False)
-def verify_all_keys_monthly():
-    for checker in key_checkers:
-        for key in list(checker.monthly_usage_reached_keys):
-            checker.verify_key(key)
-
-@app.on_event("startup")
-@repeat_every(seconds=60 * 60 * 24 * 0.5, wait_first=True)
-def verify_all_keys_daily():
-    for checker in key_checkers:
-        for key in list(checker.keys.keys()):
-            checker.verify_key(key)
\ No newline at end of file
+def start_background_work():
+    ingest_queue.start()
+    for sweep in sweeps:
+        sweep.start()